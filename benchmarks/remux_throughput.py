@@ -0,0 +1,95 @@
+"""
+Metadata remux throughput benchmark.
+
+Generates a test clip per container (or uses the files given on the
+command line), runs helper.ffmpeg.add_metadata on it a few times and
+reports MB/s. Needs ffmpeg on PATH.
+
+    python benchmarks/remux_throughput.py
+    python benchmarks/remux_throughput.py --seconds 300 --runs 5
+    python benchmarks/remux_throughput.py /path/to/episode.mkv
+"""
+
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from helper.ffmpeg import add_metadata, run_ffmpeg
+
+FIELDS = {
+    'title': 'Benchmark Title',
+    'author': 'Benchmark',
+    'artist': 'Benchmark',
+    'audio': 'Benchmark Audio',
+    'subtitle': 'Benchmark Subtitle',
+    'video': 'Benchmark Video',
+    'encoded_by': 'Benchmark',
+    'custom_tag': 'Benchmark'
+}
+
+
+async def make_sample(path, seconds):
+    """Encode a synthetic 720p clip with audio, fast enough to not dominate setup"""
+    returncode, _, stderr = await run_ffmpeg(
+        '-hide_banner', '-loglevel', 'error', '-y',
+        '-f', 'lavfi', '-i', f'testsrc2=size=1280x720:rate=24:duration={seconds}',
+        '-f', 'lavfi', '-i', f'sine=frequency=440:duration={seconds}',
+        '-c:v', 'libx264', '-preset', 'ultrafast', '-b:v', '4M',
+        '-c:a', 'aac', '-shortest',
+        path
+    )
+    if returncode != 0:
+        raise RuntimeError(stderr.decode(errors='ignore'))
+
+
+async def bench(path, runs):
+    size_mb = os.path.getsize(path) / (1024 * 1024)
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        if not await add_metadata(path, FIELDS):
+            raise RuntimeError(f"add_metadata failed for {path}")
+        timings.append(time.perf_counter() - start)
+    best = min(timings)
+    mean = sum(timings) / len(timings)
+    print(
+        f"{os.path.basename(path):<28} {size_mb:8.1f} MB   "
+        f"best {size_mb / best:8.1f} MB/s   mean {size_mb / mean:8.1f} MB/s"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('files', nargs='*', help='media files to benchmark (copied, never modified)')
+    parser.add_argument('--seconds', type=int, default=120, help='length of the generated clips')
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args()
+
+    if not shutil.which('ffmpeg'):
+        sys.exit("ffmpeg not found on PATH")
+
+    with tempfile.TemporaryDirectory() as workdir:
+        paths = []
+        if args.files:
+            for source in args.files:
+                target = os.path.join(workdir, os.path.basename(source))
+                shutil.copyfile(source, target)
+                paths.append(target)
+        else:
+            for ext in ('mkv', 'mp4'):
+                path = os.path.join(workdir, f'sample_{args.seconds}s.{ext}')
+                await make_sample(path, args.seconds)
+                paths.append(path)
+
+        for path in paths:
+            await bench(path, args.runs)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
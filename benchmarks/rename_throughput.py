@@ -0,0 +1,122 @@
+"""
+Template rename throughput benchmark.
+
+Runs helper.naming.format_filename over a corpus of release names and
+reports names/s plus how often each field was extracted. Without a
+corpus file it synthesises ~100k names in the common release styles
+(scene dots, fansub brackets, "Season x Episode y", 1x02, movies).
+
+    python benchmarks/rename_throughput.py
+    python benchmarks/rename_throughput.py --count 250000
+    python benchmarks/rename_throughput.py names.txt   # one name per line
+
+Before timing, the KNOWN_NAMES regression cases are parsed and any
+mismatch fails the run.
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from helper.naming import RENAME_FIELDS, format_filename, parse_release_name
+
+TEMPLATE = "{title} S{season}E{episode} [{quality}] [{audio}]"
+
+TITLES = [
+    "Jujutsu Kaisen", "One Piece", "Breaking Bad", "The Office", "Attack on Titan",
+    "Naruto Shippuden", "Stranger Things", "Demon Slayer", "House of the Dragon",
+    "Spy x Family", "The Last of Us", "Chainsaw Man", "Mirzapur", "Money Heist"
+]
+GROUPS = ["SubsPlease", "Erai-raws", "HorribleSubs", "Judas", "ASW", "EMBER"]
+QUALITIES = ["2160p", "1080p", "720p", "480p", "4K", "1920x1080"]
+AUDIO = ["Dual Audio", "Hindi", "English", "AAC2.0", "DDP5.1", "Multi Audio", ""]
+SOURCES = ["WEB-DL", "WEBRip", "BluRay", "HDTV", "NF", "AMZN"]
+EXTS = [".mkv", ".mp4", ".avi"]
+
+# name -> fields parse_release_name must return (fields not listed: any)
+KNOWN_NAMES = {
+    "Show.S01E05.1080p.WEB-DL.mkv": {'season': '01', 'episode': '05', 'quality': '1080p'},
+    "Show S01E01-02 1080p.mkv": {'season': '01', 'episode': '01-02', 'quality': '1080p'},
+    "Show.S02E03E04.720p.mkv": {'season': '02', 'episode': '03-04'},
+    "[Grp] Show - 05 [4x1080p].mkv": {'episode': '05', 'quality': '1080p'},
+    "Movie (2019) 1080p.mkv": {'season': '', 'episode': '', 'quality': '1080p'},
+    "One Piece - 1071 [720p].mkv": {'episode': '1071'},
+}
+
+
+def synth_name(rng):
+    title = rng.choice(TITLES)
+    season, episode = rng.randint(1, 12), rng.randint(1, 1100)
+    quality, audio = rng.choice(QUALITIES), rng.choice(AUDIO)
+    source, ext = rng.choice(SOURCES), rng.choice(EXTS)
+    style = rng.randrange(6)
+    if style == 0:
+        dotted = title.replace(" ", ".")
+        audio_part = f".{audio.replace(' ', '.')}" if audio else ""
+        return f"{dotted}.S{season:02d}E{episode:02d}.{quality}.{source}{audio_part}.x264-GRP{ext}"
+    if style == 1:
+        return f"[{rng.choice(GROUPS)}] {title} - {episode:02d} ({quality}) [{rng.randrange(16**8):08X}]{ext}"
+    if style == 2:
+        return f"{title} Season {season} Episode {episode} {audio} {quality}{ext}"
+    if style == 3:
+        return f"{title} {season}x{episode:02d} {source}{ext}"
+    if style == 4:
+        return f"{title} [{episode}] [{quality}] [{audio or 'Sub'}]{ext}"
+    return f"{title.replace(' ', '.')}.{rng.randint(1980, 2024)}.{quality}.{source}{ext}"
+
+
+def check_known_names():
+    """Regression cases for the parser; returns the mismatches"""
+    failures = []
+    for name, expected in KNOWN_NAMES.items():
+        info = parse_release_name(name)
+        wrong = {field: info[field] for field, value in expected.items() if info[field] != value}
+        if wrong:
+            failures.append(f"{name}: expected {expected}, got {wrong}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('corpus', nargs='?', help='file with one release name per line')
+    parser.add_argument('--count', type=int, default=100_000, help='synthetic names to generate')
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--template', default=TEMPLATE)
+    args = parser.parse_args()
+
+    failures = check_known_names()
+    if failures:
+        sys.exit("Parser regressions:\n  " + "\n  ".join(failures))
+
+    if args.corpus:
+        with open(args.corpus, encoding='utf-8', errors='ignore') as f:
+            names = [line.strip() for line in f if line.strip()]
+    else:
+        rng = random.Random(42)
+        names = [synth_name(rng) for _ in range(args.count)]
+
+    timings = []
+    for _ in range(args.runs):
+        start = time.perf_counter()
+        for name in names:
+            format_filename(args.template, name)
+        timings.append(time.perf_counter() - start)
+
+    hits = dict.fromkeys(RENAME_FIELDS, 0)
+    for name in names:
+        for field, value in parse_release_name(name).items():
+            if value:
+                hits[field] += 1
+
+    best = min(timings)
+    print(f"{len(names)} names   best {len(names) / best:,.0f} names/s   "
+          f"({best / len(names) * 1e6:.1f} µs/name)")
+    print("  ".join(f"{field} {hits[field] / len(names):.0%}" for field in RENAME_FIELDS))
+
+
+if __name__ == "__main__":
+    main()
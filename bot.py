@@ -9,6 +9,12 @@ from pyrogram.raw.all import layer
 from config import Config
 from aiohttp import web
 from route import web_server
+from helper.activity import activity
+from helper.broadcast import resume_broadcast
+from helper.database import DARKXSIDE78
+from helper.outbound import outbound
+from helper.source_cache import source_cache
+from helper.stats import stats_cache
 import pyrogram.utils
 from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 import os
@@ -34,6 +40,10 @@ class Bot(Client):
         # Initialize the bot's start time for uptime calculation
         self.start_time = time.time()
 
+    async def invoke(self, query, *args, **kwargs):
+        # Sends, edits and deletes are paced and FloodWait-handled centrally
+        return await outbound.invoke(super().invoke, query, *args, **kwargs)
+
     async def ping_service(self):
         """Send a ping request to the service to keep it awake."""
         while True:
@@ -52,6 +62,8 @@ class Bot(Client):
             await asyncio.sleep(300)  # 300 seconds = 5 minutes
 
     async def start(self):
+        # Index cached source files and drop downloads a crash left half-written
+        source_cache.load()
         await super().start()
         me = await self.get_me()
         self.mention = me.mention
@@ -100,8 +112,22 @@ class Bot(Client):
         # Start the ping service in the background
         asyncio.create_task(self.ping_service())
 
+        # Pick up a broadcast that was interrupted by the restart
+        asyncio.create_task(resume_broadcast(self))
+
+        # Write-behind rename/activity counters
+        activity.start()
+
+        # Idempotent index bootstrap; warns about hot queries left unindexed
+        await DARKXSIDE78.ensure_indexes()
+
+        # Leaderboard and /stats are served from a periodically rebuilt snapshot
+        stats_cache.start()
+
     async def stop(self):
         await super().stop()
+        # Don't lose counters recorded since the last periodic flush
+        await activity.stop()
         print("Bot stopped!")
 
 if __name__ == "__main__":
@@ -33,6 +33,8 @@ class Config:
     
     # Channels Configuration
     FORCE_SUB_CHANNELS = environ.get("FORCE_SUB_CHANNELS", "").split(",") if environ.get("FORCE_SUB_CHANNELS") else []
+    FSUB_MEMBER_TTL = int(environ.get("FSUB_MEMBER_TTL", "600"))  # seconds a confirmed membership is trusted
+    FSUB_NON_MEMBER_TTL = int(environ.get("FSUB_NON_MEMBER_TTL", "30"))  # seconds before a non-member is rechecked
     LOG_CHANNEL = int(environ.get("LOG_CHANNEL", "-1002433166084")) if environ.get("LOG_CHANNEL") else None
     
     # Media Configuration
@@ -53,6 +55,70 @@ class Config:
     # File Processing Configuration
     MAX_FILE_SIZE = 2 * 1024 * 1024 * 1024  # 2GB
     DOWNLOAD_LOCATION = "./downloads/"
+
+    # Streaming Transfer Configuration
+    STREAM_BUFFER_SIZE = int(environ.get("STREAM_BUFFER_SIZE", "32")) * 1024 * 1024  # MB held in memory
+    STREAM_SPILL_TO_DISK = environ.get("STREAM_SPILL_TO_DISK", "False").lower() == "true"
+    STREAM_UPLOAD_WORKERS = int(environ.get("STREAM_UPLOAD_WORKERS", "4"))  # parts in flight
+    PARALLEL_DOWNLOAD_MIN_SIZE = int(environ.get("PARALLEL_DOWNLOAD_MIN_SIZE", "20")) * 1024 * 1024  # MB, smaller files use one stream
+    PARALLEL_DOWNLOAD_MIN_WORKERS = int(environ.get("PARALLEL_DOWNLOAD_MIN_WORKERS", "2"))  # connections to start with
+    PARALLEL_DOWNLOAD_MAX_WORKERS = int(environ.get("PARALLEL_DOWNLOAD_MAX_WORKERS", "6"))  # connections at most
+
+    # FFmpeg Configuration
+    FFMPEG_WORKERS = int(environ.get("FFMPEG_WORKERS", "2"))  # ffmpeg processes at once
+    SAMPLE_DURATION = int(environ.get("SAMPLE_DURATION", "30"))  # seconds
+    SCREENSHOT_COUNT = min(int(environ.get("SCREENSHOT_COUNT", "6")), 10)  # one album, max 10
+
+    # Progress Configuration
+    PROGRESS_INTERVAL = int(environ.get("PROGRESS_INTERVAL", "5"))  # minimum seconds between edits of a status message
+
+    # Thumbnail Configuration
+    THUMB_CACHE_DIR = "./thumbnails/"
+    THUMB_CACHE_SIZE = int(environ.get("THUMB_CACHE_SIZE", "50")) * 1024 * 1024  # MB on disk
+
+    # Source File Cache Configuration (same filesystem as DOWNLOAD_LOCATION, for hard links)
+    SOURCE_CACHE_DIR = "./downloads/source_cache/"
+    SOURCE_CACHE_SIZE = int(environ.get("SOURCE_CACHE_SIZE", "0")) * 1024 * 1024  # MB on disk, 0 = off
+
+    # Job Scheduler Configuration
+    MAX_CONCURRENT_JOBS = int(environ.get("MAX_CONCURRENT_JOBS", "8"))  # renames running at once
+    MAX_JOBS_PER_USER = int(environ.get("MAX_JOBS_PER_USER", "2"))  # per user, across all lanes
+    BATCH_QUIET_PERIOD = int(environ.get("BATCH_QUIET_PERIOD", "30"))  # seconds without a new file before a batch runs
+    MEDIA_GROUP_QUIET_PERIOD = 3  # albums arrive as a quick burst of messages
+    BATCH_MAX_FILES = int(environ.get("BATCH_MAX_FILES", "100"))
+    SEQUENCE_WINDOW = int(environ.get("SEQUENCE_WINDOW", "4"))  # files downloaded ahead of the next in-order upload
+
+    # Outbound API Configuration
+    OUTBOUND_GLOBAL_RATE = int(environ.get("OUTBOUND_GLOBAL_RATE", "28"))  # sends/edits per second across all chats
+    OUTBOUND_CHAT_RATE = float(environ.get("OUTBOUND_CHAT_RATE", "1"))  # sustained per chat
+    OUTBOUND_CHAT_BURST = 3
+    OUTBOUND_WORKERS = int(environ.get("OUTBOUND_WORKERS", "8"))
+    OUTBOUND_MAX_WAIT = 60  # longer FloodWaits are raised to the caller instead of retried
+
+    # Broadcast Configuration
+    BROADCAST_RATE = int(environ.get("BROADCAST_RATE", "25"))  # messages per second, Telegram allows ~30
+    BROADCAST_WORKERS = int(environ.get("BROADCAST_WORKERS", "20"))  # concurrent senders
+    BROADCAST_CHUNK = 500  # users per checkpoint
+
+    # Activity Tracking Configuration
+    ACTIVITY_FLUSH_INTERVAL = int(environ.get("ACTIVITY_FLUSH_INTERVAL", "60"))  # seconds between counter flushes
+
+    # Token Metering Configuration
+    RENAME_TOKEN_COST = int(environ.get("RENAME_TOKEN_COST", "1"))  # tokens per renamed file, premium users are free
+
+    # Output Cache Configuration
+    OUTPUT_CACHE_DAYS = int(environ.get("OUTPUT_CACHE_DAYS", "30"))  # how long an uploaded result is reused
+
+    # Stats Configuration
+    STATS_REFRESH_INTERVAL = int(environ.get("STATS_REFRESH_INTERVAL", "300"))  # seconds between leaderboard/totals rebuilds
+    LEADERBOARD_SIZE = int(environ.get("LEADERBOARD_SIZE", "10"))
+
+    # Database Diagnostics
+    SLOW_QUERY_MS = int(environ.get("SLOW_QUERY_MS", "100"))  # log Mongo commands slower than this
+
+    # Database Cache Configuration
+    USER_CACHE_TTL = int(environ.get("USER_CACHE_TTL", "300"))  # seconds
+    USER_CACHE_SIZE = int(environ.get("USER_CACHE_SIZE", "5000"))  # user documents
     
     # Anti-NSFW Configuration
     ANTI_NSFW_ENABLED = environ.get("ANTI_NSFW_ENABLED", "True").lower() == "true"
@@ -159,11 +225,14 @@ class Txt:
 **📝 Auto Rename Tutorial:**
 
 **Available Variables:**
-• `episode` or `Episode` or `EPISODE` - Episode number
-• `quality` or `Quality` or `QUALITY` - Video quality
+• `{{title}}` - Show/movie title
+• `{{season}}` - Season number
+• `{{episode}}` - Episode number
+• `{{quality}}` - Video quality (1080p, 720p...)
+• `{{audio}}` - Audio (Dual Audio, Hindi, AAC...)
 
 **Example Format:**
-`Naruto Episode [episode] [quality]`
+`{{title}} S{{season}}E{{episode}} [{{quality}}] [{{audio}}]`
 
 **Current Template:** `{format_template}`
 
@@ -0,0 +1,117 @@
+import asyncio
+import datetime
+import logging
+from collections import defaultdict
+from pymongo import UpdateOne
+from config import Config
+from helper.database import DARKXSIDE78
+
+
+class ActivityTracker:
+    """Write-behind counters for renames and user activity.
+
+    Renames and interactions are only tallied in memory; every
+    ACTIVITY_FLUSH_INTERVAL seconds (and on shutdown) the tallies go to
+    Mongo as one unordered bulk_write per collection, `$inc` for the
+    counters and `$max` for last_active. A failed flush keeps its
+    tallies for the next one.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._renames = defaultdict(lambda: [0, 0])  # user -> [count, bytes]
+        self._daily = defaultdict(lambda: [0, 0])  # (user, day) -> [count, bytes]
+        self._last_active = {}  # user -> datetime
+        self._task = None
+        self._lock = asyncio.Lock()
+
+    def record_rename(self, message):
+        """Count one successful rename of `message`'s file"""
+        media = message.document or message.video or message.audio
+        user_id = message.from_user.id
+        size = getattr(media, 'file_size', 0) or 0
+        day = datetime.datetime.now(datetime.timezone.utc).date().isoformat()
+        for tally in (self._renames[user_id], self._daily[(user_id, day)]):
+            tally[0] += 1
+            tally[1] += size
+        self.touch(user_id)
+
+    def touch(self, user_id):
+        """Mark the user as active now"""
+        self._last_active[user_id] = datetime.datetime.now(datetime.timezone.utc)
+
+    async def flush(self):
+        async with self._lock:
+            renames, self._renames = self._renames, defaultdict(lambda: [0, 0])
+            daily, self._daily = self._daily, defaultdict(lambda: [0, 0])
+            last_active, self._last_active = self._last_active, {}
+            if not (renames or daily or last_active):
+                return
+
+            user_ops = []
+            for user_id in set(renames) | set(last_active):
+                update = {}
+                if user_id in renames:
+                    count, size = renames[user_id]
+                    update["$inc"] = {"rename_count": count, "rename_bytes": size}
+                if user_id in last_active:
+                    update["$max"] = {"last_active": last_active[user_id]}
+                # No upsert: unknown users (never /start'ed) aren't created here
+                user_ops.append(UpdateOne({"_id": int(user_id)}, update))
+            daily_ops = [
+                UpdateOne(
+                    {"_id": {"user": int(user_id), "day": day}},
+                    {"$inc": {"count": count, "bytes": size}},
+                    upsert=True
+                )
+                for (user_id, day), (count, size) in daily.items()
+            ]
+
+            # Each collection is retried on its own so a half-failed flush
+            # never counts the half that did land twice
+            if user_ops:
+                try:
+                    await DARKXSIDE78.col.bulk_write(user_ops, ordered=False)
+                except Exception as e:
+                    logging.error(f"Activity flush failed, keeping user counters for retry: {e}")
+                    self._merge_back(self._renames, renames)
+                    for user_id, at in last_active.items():
+                        # A touch since the failed flush is newer; keep it
+                        self._last_active.setdefault(user_id, at)
+            if daily_ops:
+                try:
+                    await DARKXSIDE78.daily_stats.bulk_write(daily_ops, ordered=False)
+                except Exception as e:
+                    logging.error(f"Activity flush failed, keeping daily counters for retry: {e}")
+                    self._merge_back(self._daily, daily)
+
+    @staticmethod
+    def _merge_back(pending, failed):
+        for key, (count, size) in failed.items():
+            pending[key][0] += count
+            pending[key][1] += size
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the periodic flush and write out whatever is pending"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        # Waits on the lock for a flush still in flight from _run
+        await asyncio.shield(self.flush())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                # Shielded: cancelling the loop mid-write would drop the
+                # counters already swapped out of memory
+                await asyncio.shield(self.flush())
+            except Exception as e:
+                logging.error(f"Activity flush error: {e}")
+
+
+activity = ActivityTracker(Config.ACTIVITY_FLUSH_INTERVAL)
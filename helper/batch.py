@@ -0,0 +1,112 @@
+import asyncio
+import logging
+
+
+class BatchSession:
+    """Files collected for one batch, plus the timer that closes it"""
+
+    def __init__(self, key, on_close, quiet_period, max_files, status=None):
+        self.key = key
+        self.on_close = on_close
+        self.quiet_period = quiet_period
+        self.max_files = max_files
+        self.status = status
+        self.messages = []
+        self._timer = None
+
+
+class BatchCollector:
+    """Collects bursts of files into batches.
+
+    A session stays open until it's closed explicitly, reaches
+    `max_files`, or sees no new file for its quiet period; then
+    `on_close(session)` runs once in its own task.
+    """
+
+    def __init__(self):
+        self._sessions = {}
+
+    def open(self, key, on_close, quiet_period, max_files, status=None):
+        session = self._sessions.get(key)
+        if session is None:
+            session = BatchSession(key, on_close, quiet_period, max_files, status)
+            self._sessions[key] = session
+            self._arm(session)
+        return session
+
+    def get(self, key):
+        return self._sessions.get(key)
+
+    def add(self, key, message):
+        """Add a file to an open session; False if there is none"""
+        session = self._sessions.get(key)
+        if session is None:
+            return False
+        session.messages.append(message)
+        if len(session.messages) >= session.max_files:
+            self.close(key)
+        else:
+            self._arm(session)
+        return True
+
+    def close(self, key):
+        """Close a session now and run its handler; returns the session or None"""
+        session = self._sessions.pop(key, None)
+        if session is None:
+            return None
+        if session._timer is not None:
+            session._timer.cancel()
+        asyncio.create_task(self._run(session))
+        return session
+
+    def cancel(self, key):
+        """Drop a session without processing it"""
+        session = self._sessions.pop(key, None)
+        if session is not None and session._timer is not None:
+            session._timer.cancel()
+        return session
+
+    def _arm(self, session):
+        if session._timer is not None:
+            session._timer.cancel()
+        session._timer = asyncio.get_running_loop().call_later(
+            session.quiet_period, self.close, session.key
+        )
+
+    async def _run(self, session):
+        try:
+            await session.on_close(session)
+        except Exception as e:
+            logging.error(f"Batch processing error: {e}")
+
+
+class ReorderBuffer:
+    """Lets jobs run concurrently but finish strictly in index order.
+
+    A job first `reserve`s its index, which waits while it is `window` or
+    more places ahead of the next index to be released; that caps how
+    many finished-but-unreleased results (local files) exist at once.
+    It then does its work, waits for `turn`, and must `release` so the
+    next index can go, whether it succeeded or not.
+    """
+
+    def __init__(self, window):
+        self.window = max(1, window)
+        self._next = 0
+        self._changed = asyncio.Condition()
+
+    async def reserve(self, index):
+        async with self._changed:
+            await self._changed.wait_for(lambda: index < self._next + self.window)
+
+    async def turn(self, index):
+        async with self._changed:
+            await self._changed.wait_for(lambda: index == self._next)
+
+    async def release(self):
+        async with self._changed:
+            self._next += 1
+            self._changed.notify_all()
+
+
+batch_sessions = BatchCollector()
@@ -0,0 +1,197 @@
+import asyncio
+import datetime
+import logging
+import time
+from pyrogram.errors import FloodWait, InputUserDeactivated, UserIsBlocked, PeerIdInvalid
+from config import Config
+from helper.database import DARKXSIDE78
+from helper.outbound import TokenBucket, broadcasting
+
+logger = logging.getLogger(__name__)
+
+# Minimum seconds between edits of the broadcast status message
+STATUS_INTERVAL = 10
+
+# Task of the broadcast running in this process, if any
+_current = None
+
+
+async def send_msg(bucket, user_id, message, attempts=3):
+    """Copy `message` to a user: 200 sent, 400 dead user, 500 other failure"""
+    for _ in range(attempts):
+        await bucket.acquire()
+        lane = broadcasting.set(True)
+        try:
+            await message.copy(chat_id=int(user_id))
+            return 200
+        except FloodWait as e:
+            # Only waits over OUTBOUND_MAX_WAIT reach us (shorter ones are
+            # retried by the scheduler); hold the whole broadcast that long
+            bucket.pause(e.value)
+        except InputUserDeactivated:
+            logger.info(f"{user_id} : Deactivated")
+            return 400
+        except UserIsBlocked:
+            logger.info(f"{user_id} : Blocked The Bot")
+            return 400
+        except PeerIdInvalid:
+            logger.info(f"{user_id} : User ID Invalid")
+            return 400
+        except Exception as e:
+            logger.error(f"{user_id} : {e}")
+            return 500
+        finally:
+            broadcasting.reset(lane)
+    return 500
+
+
+def _status_text(state, finished=False):
+    title = "Bʀᴏᴀᴅᴄᴀꜱᴛ Cᴏᴍᴩʟᴇᴛᴇᴅ:" if finished else "Broadcast In Progress:"
+    elapsed = datetime.timedelta(seconds=int(state['elapsed']))
+    return (
+        f"{title}\n{'Cᴏᴍᴩʟᴇᴛᴇᴅ Iɴ' if finished else 'Running For'} `{elapsed}`.\n\n"
+        f"Total Users {state['total']}\n"
+        f"Completed: {state['done']} / {state['total']}\n"
+        f"Success: {state['success']}\n"
+        f"Failed: {state['failed']}\n"
+        f"Removed: {state['removed']}"
+    )
+
+
+async def run_broadcast(bot, message, status_msg, state):
+    """Send `message` to every user after `state['last_id']`.
+
+    Users are read in `_id` order in chunks of BROADCAST_CHUNK. Each chunk
+    is sent by BROADCAST_WORKERS concurrent senders sharing one token
+    bucket. After a chunk its dead users are deleted in one query and the
+    checkpoint (last `_id`, counters) is saved, so a restart resumes from
+    the last finished chunk.
+    """
+    bucket = TokenBucket(Config.BROADCAST_RATE)
+    started = time.monotonic() - state['elapsed']
+    last_edit = time.monotonic()
+
+    async def send_chunk(user_ids):
+        queue = asyncio.Queue()
+        for user_id in user_ids:
+            queue.put_nowait(user_id)
+        dead = []
+
+        async def sender():
+            while not queue.empty():
+                user_id = queue.get_nowait()
+                sts = await send_msg(bucket, user_id, message)
+                if sts == 200:
+                    state['success'] += 1
+                else:
+                    state['failed'] += 1
+                if sts == 400:
+                    dead.append(user_id)
+                state['done'] += 1
+
+        await asyncio.gather(*(sender() for _ in range(min(Config.BROADCAST_WORKERS, len(user_ids)))))
+        state['removed'] += await DARKXSIDE78.delete_users(dead)
+        state['last_id'] = user_ids[-1]
+        state['elapsed'] = time.monotonic() - started
+        await DARKXSIDE78.save_broadcast_state(state)
+
+    chunk = []
+    async for user_id in DARKXSIDE78.iter_user_ids(state['last_id']):
+        chunk.append(user_id)
+        if len(chunk) < Config.BROADCAST_CHUNK:
+            continue
+        await send_chunk(chunk)
+        chunk = []
+        if time.monotonic() - last_edit >= STATUS_INTERVAL:
+            last_edit = time.monotonic()
+            try:
+                await status_msg.edit(_status_text(state))
+            except Exception:
+                pass
+    if chunk:
+        await send_chunk(chunk)
+
+    state['elapsed'] = time.monotonic() - started
+    await DARKXSIDE78.clear_broadcast_state()
+    await status_msg.edit(_status_text(state, finished=True))
+
+
+def is_running():
+    return _current is not None and not _current.done()
+
+
+async def _run_reported(bot, message, status_msg, state):
+    try:
+        await run_broadcast(bot, message, status_msg, state)
+    except asyncio.CancelledError:
+        try:
+            await status_msg.edit(f"{_status_text(state)}\n\nBroadcast cancelled.")
+        except Exception:
+            pass
+        raise
+    except Exception as e:
+        # The checkpoint stays; nothing resumes it until an admin decides
+        logger.error(f"Broadcast stopped: {e}")
+        try:
+            await status_msg.edit(
+                f"{_status_text(state)}\n\n❌ Broadcast stopped: `{e}`\n"
+                "Send `/broadcast resume` to continue from the last checkpoint "
+                "or `/broadcast cancel` to drop it."
+            )
+        except Exception:
+            pass
+
+
+def _launch(bot, message, status_msg, state):
+    global _current
+    _current = asyncio.create_task(_run_reported(bot, message, status_msg, state))
+    return _current
+
+
+async def cancel_broadcast():
+    """Stop the running broadcast, if any, and drop its checkpoint"""
+    if is_running():
+        _current.cancel()
+        await asyncio.gather(_current, return_exceptions=True)
+    await DARKXSIDE78.clear_broadcast_state()
+
+
+async def start_broadcast(bot, message, status_msg):
+    """Start a new broadcast of `message` in the background, checkpointed from the first user"""
+    state = {
+        'chat_id': message.chat.id,
+        'message_id': message.id,
+        'status_chat_id': status_msg.chat.id,
+        'last_id': None,
+        'total': await DARKXSIDE78.total_users_count(),
+        'done': 0,
+        'success': 0,
+        'failed': 0,
+        'removed': 0,
+        'elapsed': 0
+    }
+    await DARKXSIDE78.save_broadcast_state(state)
+    return _launch(bot, message, status_msg, state)
+
+
+async def resume_broadcast(bot, reason="after restart"):
+    """Continue an interrupted broadcast from its checkpoint, if there is one"""
+    state = await DARKXSIDE78.get_broadcast_state()
+    if not state or is_running():
+        return False
+    state.pop('_id', None)
+    try:
+        message = await bot.get_messages(state['chat_id'], state['message_id'])
+        if not message or message.empty:
+            raise ValueError("broadcast message no longer exists")
+    except Exception as e:
+        logger.error(f"Can't resume broadcast: {e}")
+        await DARKXSIDE78.clear_broadcast_state()
+        return False
+
+    status_msg = await bot.send_message(
+        state['status_chat_id'],
+        f"Broadcast Resumed {reason} at {state['done']} / {state['total']}..."
+    )
+    _launch(bot, message, status_msg, state)
+    return True
@@ -0,0 +1,52 @@
+import logging
+import os
+from helper.ffmpeg import probe_media
+from helper.naming import compile_template, parse_release_name
+from helper.utils import humanbytes, convert
+
+CAPTION_FIELDS = ('filename', 'filesize', 'duration', 'resolution', 'season', 'episode')
+# Fields that need the media probed when the message doesn't carry them
+_PROBED_FIELDS = frozenset({'duration', 'resolution'})
+
+
+async def render_caption(template, message, file_name, file_path=None):
+    """Fill the user's caption template for one upload.
+
+    Falls back to the filename when no caption is set. Duration and
+    resolution come from the message media, and ffprobe only runs on
+    `file_path` when the template asks for them and Telegram didn't
+    report them.
+    """
+    if not template:
+        return file_name
+
+    compiled = compile_template(template, CAPTION_FIELDS)
+    if not compiled.fields:
+        return compiled.render({})
+
+    media = message.document or message.video or message.audio
+    values = {'filename': file_name}
+
+    if 'filesize' in compiled.fields:
+        size = os.path.getsize(file_path) if file_path and os.path.exists(file_path) else getattr(media, 'file_size', 0)
+        values['filesize'] = humanbytes(size)
+
+    if compiled.fields & _PROBED_FIELDS:
+        duration = getattr(message.video or message.audio, 'duration', 0) or 0
+        width = getattr(message.video, 'width', 0) or 0
+        height = getattr(message.video, 'height', 0) or 0
+        if file_path and (not duration or (not height and 'resolution' in compiled.fields)):
+            try:
+                info = await probe_media(file_path)
+                duration = duration or info['duration']
+                width, height = width or info['width'], height or info['height']
+            except Exception as e:
+                logging.error(f"Caption probe error: {e}")
+        values['duration'] = convert(int(duration)) if duration else ''
+        values['resolution'] = f"{width}x{height}" if width and height else ''
+
+    if compiled.fields & {'season', 'episode'}:
+        info = parse_release_name(file_name)
+        values['season'], values['episode'] = info['season'], info['episode']
+
+    return compiled.render(values)
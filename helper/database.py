@@ -1,13 +1,72 @@
 import motor.motor_asyncio
+from pymongo import ASCENDING, DESCENDING, IndexModel, ReturnDocument, monitoring
 import datetime
+import time
 import pytz
+from collections import OrderedDict
 from config import Config
 import logging
 
+# Per-stream/container tags stored on the user document
+METADATA_FIELDS = (
+    'title', 'author', 'artist', 'audio', 'subtitle', 'video', 'encoded_by', 'custom_tag'
+)
+
+# Fields read by Database.get_rename_context
+RENAME_CONTEXT_FIELDS = (
+    'file_id', 'caption', 'format_template', 'media_type', 'metadata',
+    'is_premium', 'premium_expiry', 'token',
+    'upload_mode', 'send_as', 'upload_destination', 'prefix', 'suffix',
+    'rename_mode', 'remove_words', 'sample_video', 'screenshot_enabled',
+    'ai_autorename', 'manual_mode'
+) + METADATA_FIELDS
+
+class _SlowQueryListener(monitoring.CommandListener):
+    """Logs every Mongo command slower than SLOW_QUERY_MS, with its filter"""
+
+    _WATCHED = {'find', 'aggregate', 'count', 'update', 'delete', 'findAndModify', 'distinct'}
+
+    def __init__(self, threshold_ms):
+        self.threshold_ms = threshold_ms
+        self._pending = {}
+
+    def started(self, event):
+        if event.command_name in self._WATCHED:
+            command = event.command
+            query = command.get('filter', command.get('query', command.get('pipeline')))
+            self._pending[event.request_id] = (command.get(event.command_name), query)
+
+    def succeeded(self, event):
+        pending = self._pending.pop(event.request_id, None)
+        if pending is not None and event.duration_micros >= self.threshold_ms * 1000:
+            collection, query = pending
+            logging.warning(
+                f"Slow Mongo {event.command_name} on {collection}: "
+                f"{event.duration_micros // 1000} ms, query {query}"
+            )
+
+    def failed(self, event):
+        self._pending.pop(event.request_id, None)
+
+def _has_collscan(plan):
+    if isinstance(plan, dict):
+        if plan.get('stage') == 'COLLSCAN':
+            return True
+        return any(_has_collscan(value) for value in plan.values())
+    if isinstance(plan, list):
+        return any(_has_collscan(value) for value in plan)
+    return False
+
+def _premium_active(user, now):
+    expiry = user.get('premium_expiry')
+    return bool(user.get('is_premium', False)) and (expiry is None or expiry > now)
+
 class Database:
     def __init__(self, uri, database_name):
         try:
-            self._client = motor.motor_asyncio.AsyncIOMotorClient(uri)
+            self._client = motor.motor_asyncio.AsyncIOMotorClient(
+                uri, event_listeners=[_SlowQueryListener(Config.SLOW_QUERY_MS)]
+            )
             self._client.server_info()
             logging.info("Successfully connected to MongoDB")
         except Exception as e:
@@ -16,6 +75,75 @@ class Database:
         self.DARKXSIDE78 = self._client[database_name]
         self.col = self.DARKXSIDE78.user
         self.token_links = self.DARKXSIDE78.token_links  # Token links collection
+        self.broadcasts = self.DARKXSIDE78.broadcasts  # Broadcast checkpoints
+        self.daily_stats = self.DARKXSIDE78.daily_stats  # Per-user, per-day rename counters
+        self.stats = self.DARKXSIDE78.stats  # Materialized leaderboard and totals
+        self.output_cache = self.DARKXSIDE78.output_cache  # Uploaded file_id per (source, settings)
+
+        # In-process user document cache (LRU with TTL), see _get_user
+        self._user_cache = OrderedDict()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    # USER DOCUMENT CACHE
+
+    async def _get_user(self, user_id, fields=None):
+        """Get a user document, served from the in-process cache when fresh.
+
+        With `fields`, a miss fetches only those fields; the partial document
+        is cached and only serves later lookups asking for a subset of them.
+        """
+        user_id = int(user_id)
+        entry = self._user_cache.get(user_id)
+        if entry is not None and entry[0] > time.monotonic():
+            cached_fields = entry[2]
+            if cached_fields is None or (fields is not None and cached_fields.issuperset(fields)):
+                self._user_cache.move_to_end(user_id)
+                self.cache_hits += 1
+                return entry[1]
+
+        self.cache_misses += 1
+        projection = dict.fromkeys(fields, 1) if fields else None
+        user = await self.col.find_one({"_id": user_id}, projection)
+        if user is not None:
+            self._user_cache[user_id] = (
+                time.monotonic() + Config.USER_CACHE_TTL,
+                user,
+                set(fields) if fields else None
+            )
+            self._user_cache.move_to_end(user_id)
+            while len(self._user_cache) > Config.USER_CACHE_SIZE:
+                self._user_cache.popitem(last=False)
+        else:
+            self._user_cache.pop(user_id, None)
+        return user
+
+    def _cache_update(self, user_id, fields):
+        """Write-through: apply a $set to the cached document, if any"""
+        entry = self._user_cache.get(int(user_id))
+        if entry is None:
+            return
+        if any('.' in key for key in fields):
+            # Dotted paths would need a nested merge, just drop the entry
+            self.invalidate_user(user_id)
+            return
+        entry[1].update(fields)
+        if entry[2] is not None:
+            entry[2].update(fields)
+
+    def invalidate_user(self, user_id):
+        """Drop a user from the cache after a write that bypassed the setters"""
+        self._user_cache.pop(int(user_id), None)
+
+    def cache_stats(self):
+        """Hit/miss counters for the user document cache"""
+        total = self.cache_hits + self.cache_misses
+        return {
+            'hits': self.cache_hits,
+            'misses': self.cache_misses,
+            'hit_rate': (self.cache_hits / total * 100) if total else 0.0,
+            'size': len(self._user_cache)
+        }
 
     def new_user(self, id):
         return dict(
@@ -71,21 +199,75 @@ class Database:
             user["username"] = u.username or ""
             try:
                 await self.col.insert_one(user)
+                self.invalidate_user(u.id)
                 logging.info(f"User {u.id} added to database")
             except Exception as e:
                 logging.error(f"Error adding user {u.id} to database: {e}")
 
     async def is_user_exist(self, id):
         try:
-            user = await self.col.find_one({"_id": int(id)})
+            user = await self._get_user(id)
             return bool(user)
         except Exception as e:
             logging.error(f"Error checking if user {id} exists: {e}")
             return False
 
+    async def ensure_indexes(self):
+        """Create the indexes hot queries rely on, then check they're used.
+
+        Safe to run on every startup: existing indexes with the same spec
+        are left alone. Each index is created on its own, so one that
+        conflicts with an existing spec is logged without skipping the rest.
+        """
+        indexes = [
+            (self.col, IndexModel([("rename_count", DESCENDING)], name="rename_count_desc")),
+            (self.col, IndexModel([("username", ASCENDING)], name="username")),
+            (self.col, IndexModel(
+                [("is_premium", ASCENDING), ("premium_expiry", ASCENDING)],
+                name="premium_expiry",
+                partialFilterExpression={"is_premium": True}
+            )),
+            (self.col, IndexModel(
+                [("ban_status.is_banned", ASCENDING)],
+                name="banned",
+                partialFilterExpression={"ban_status.is_banned": True}
+            )),
+            # Expired links are deleted by Mongo itself; used ones get
+            # their expiry set to the redemption time, see claim_token_link
+            (self.token_links, IndexModel("expiry", name="expiry_ttl", expireAfterSeconds=0)),
+            (self.output_cache, IndexModel(
+                "created", name="created_ttl", expireAfterSeconds=Config.OUTPUT_CACHE_DAYS * 86400
+            )),
+        ]
+        for collection, index in indexes:
+            try:
+                await collection.create_indexes([index])
+            except Exception as e:
+                logging.error(f"Error creating index {index.document['name']} on {collection.name}: {e}")
+        await self._report_unindexed_queries()
+
+    async def _report_unindexed_queries(self):
+        """Warn about hot query shapes the planner would answer with a collection scan"""
+        now = datetime.datetime.now()
+        hot_queries = {
+            'leaderboard': self.col.find({"rename_count": {"$gt": 0}}).sort("rename_count", -1).limit(10),
+            'user by username': self.col.find({"username": "_"}),
+            'expired premium': self.col.find({"is_premium": True, "premium_expiry": {"$lt": now}}),
+            'banned users': self.col.find({"ban_status.is_banned": True}),
+        }
+        for name, cursor in hot_queries.items():
+            try:
+                plan = await cursor.explain()
+            except Exception as e:
+                logging.error(f"Can't explain {name} query: {e}")
+                continue
+            if _has_collscan(plan.get('queryPlanner', {}).get('winningPlan')):
+                logging.warning(f"The {name} query runs as a collection scan; is its index missing?")
+
     async def total_users_count(self):
         try:
-            count = await self.col.count_documents({})
+            # Collection metadata instead of a full count_documents scan
+            count = await self.col.estimated_document_count()
             return count
         except Exception as e:
             logging.error(f"Error counting users: {e}")
@@ -99,21 +281,123 @@ class Database:
             logging.error(f"Error getting all users: {e}")
             return None
 
+    async def iter_user_ids(self, after_id=None, batch_size=1000):
+        """Yield user ids in ascending order, starting after `after_id`"""
+        query = {"_id": {"$gt": after_id}} if after_id is not None else {}
+        cursor = self.col.find(query, {"_id": 1}).sort("_id", 1).batch_size(batch_size)
+        async for user in cursor:
+            yield user["_id"]
+
+    async def delete_users(self, user_ids):
+        """Delete many users in a single round trip"""
+        if not user_ids:
+            return 0
+        try:
+            result = await self.col.delete_many({"_id": {"$in": [int(uid) for uid in user_ids]}})
+            for user_id in user_ids:
+                self.invalidate_user(user_id)
+            return result.deleted_count
+        except Exception as e:
+            logging.error(f"Error deleting {len(user_ids)} users: {e}")
+            return 0
+
+    # MATERIALIZED STATS
+
+    async def build_stats(self, top_n=10):
+        """Compute the leaderboard and totals and save them as one document"""
+        leaderboard = await self.col.find(
+            {"rename_count": {"$gt": 0}},
+            {"first_name": 1, "username": 1, "rename_count": 1}
+        ).sort("rename_count", -1).limit(top_n).to_list(top_n)
+        totals = await self.col.aggregate([
+            {"$group": {"_id": None, "renames": {"$sum": "$rename_count"}, "bytes": {"$sum": "$rename_bytes"}}}
+        ]).to_list(1)
+        totals = totals[0] if totals else {}
+        stats = {
+            "_id": "summary",
+            "leaderboard": leaderboard,
+            "total_users": await self.total_users_count(),
+            "total_renames": totals.get("renames", 0),
+            "total_bytes": totals.get("bytes", 0),
+            "updated": datetime.datetime.now(pytz.utc)
+        }
+        try:
+            await self.stats.replace_one({"_id": "summary"}, stats, upsert=True)
+        except Exception as e:
+            logging.error(f"Error saving stats: {e}")
+        return stats
+
+    async def get_saved_stats(self):
+        try:
+            return await self.stats.find_one({"_id": "summary"})
+        except Exception as e:
+            logging.error(f"Error getting saved stats: {e}")
+            return None
+
+    # OUTPUT CACHE
+
+    async def get_cached_output(self, file_unique_id, settings_hash):
+        try:
+            entry = await self.output_cache.find_one({"_id": {"src": file_unique_id, "key": settings_hash}})
+            return entry["file_id"] if entry else None
+        except Exception as e:
+            logging.error(f"Error reading output cache for {file_unique_id}: {e}")
+            return None
+
+    async def save_cached_output(self, file_unique_id, settings_hash, file_id):
+        try:
+            await self.output_cache.replace_one(
+                {"_id": {"src": file_unique_id, "key": settings_hash}},
+                {"file_id": file_id, "created": datetime.datetime.now(pytz.utc)},
+                upsert=True
+            )
+        except Exception as e:
+            logging.error(f"Error saving output cache for {file_unique_id}: {e}")
+
+    async def drop_cached_output(self, file_unique_id, settings_hash):
+        try:
+            await self.output_cache.delete_one({"_id": {"src": file_unique_id, "key": settings_hash}})
+        except Exception as e:
+            logging.error(f"Error dropping output cache for {file_unique_id}: {e}")
+
+    # BROADCAST CHECKPOINTS
+
+    async def save_broadcast_state(self, state):
+        try:
+            await self.broadcasts.replace_one({"_id": "current"}, {**state, "_id": "current"}, upsert=True)
+        except Exception as e:
+            logging.error(f"Error saving broadcast checkpoint: {e}")
+
+    async def get_broadcast_state(self):
+        try:
+            return await self.broadcasts.find_one({"_id": "current"})
+        except Exception as e:
+            logging.error(f"Error getting broadcast checkpoint: {e}")
+            return None
+
+    async def clear_broadcast_state(self):
+        try:
+            await self.broadcasts.delete_one({"_id": "current"})
+        except Exception as e:
+            logging.error(f"Error clearing broadcast checkpoint: {e}")
+
     async def delete_user(self, user_id):
         try:
             await self.col.delete_many({"_id": int(user_id)})
+            self.invalidate_user(user_id)
         except Exception as e:
             logging.error(f"Error deleting user {user_id}: {e}")
 
     async def set_thumbnail(self, id, file_id):
         try:
             await self.col.update_one({"_id": int(id)}, {"$set": {"file_id": file_id}})
+            self._cache_update(id, {"file_id": file_id})
         except Exception as e:
             logging.error(f"Error setting thumbnail for user {id}: {e}")
 
     async def get_thumbnail(self, id):
         try:
-            user = await self.col.find_one({"_id": int(id)})
+            user = await self._get_user(id)
             return user.get("file_id", None) if user else None
         except Exception as e:
             logging.error(f"Error getting thumbnail for user {id}: {e}")
@@ -122,12 +406,13 @@ class Database:
     async def set_caption(self, id, caption):
         try:
             await self.col.update_one({"_id": int(id)}, {"$set": {"caption": caption}})
+            self._cache_update(id, {"caption": caption})
         except Exception as e:
             logging.error(f"Error setting caption for user {id}: {e}")
 
     async def get_caption(self, id):
         try:
-            user = await self.col.find_one({"_id": int(id)})
+            user = await self._get_user(id)
             return user.get("caption", None) if user else None
         except Exception as e:
             logging.error(f"Error getting caption for user {id}: {e}")
@@ -138,12 +423,13 @@ class Database:
             await self.col.update_one(
                 {"_id": int(id)}, {"$set": {"format_template": format_template}}
             )
+            self._cache_update(id, {"format_template": format_template})
         except Exception as e:
             logging.error(f"Error setting format template for user {id}: {e}")
 
     async def get_format_template(self, id):
         try:
-            user = await self.col.find_one({"_id": int(id)})
+            user = await self._get_user(id)
             return user.get("format_template", None) if user else None
         except Exception as e:
             logging.error(f"Error getting format template for user {id}: {e}")
@@ -176,6 +462,22 @@ class Database:
             logging.error(f"Error fetching token link for token ID {token_id}: {e}")
             return None
 
+    async def claim_token_link(self, token_id: str, user_id: int):
+        """Mark an unused, unexpired link of `user_id` used; returns it or None.
+
+        Matching and marking happen in one update, so a link can't be
+        redeemed twice. Its expiry moves to now so the TTL index removes it.
+        """
+        now = datetime.datetime.now(pytz.utc)
+        try:
+            return await self.token_links.find_one_and_update(
+                {"_id": token_id, "user_id": user_id, "used": False, "expiry": {"$gt": now}},
+                {"$set": {"used": True, "expiry": now}}
+            )
+        except Exception as e:
+            logging.error(f"Error claiming token link {token_id}: {e}")
+            return None
+
     async def mark_token_used(self, token_id: str):
         try:
             await self.token_links.update_one(
@@ -192,29 +494,84 @@ class Database:
                 {"_id": int(user_id)},
                 {"$set": {"token": token}}
             )
+            self._cache_update(user_id, {"token": token})
             logging.info(f"Token updated for user {user_id}.")
         except Exception as e:
             logging.error(f"Error setting token for user {user_id}: {e}")
 
     async def get_token(self, user_id):
         try:
-            user = await self.col.find_one({"_id": int(user_id)})
+            user = await self._get_user(user_id)
             return user.get("token", 69) if user else 69
         except Exception as e:
             logging.error(f"Error getting token for user {user_id}: {e}")
             return 69
 
+    async def reserve_tokens(self, user_id, cost):
+        """Atomically charge `cost` tokens unless the user has active premium.
+
+        One conditional find_one_and_update: it only matches while the user
+        is premium or still has `cost` tokens, so concurrent jobs can't
+        overspend. Returns the amount charged (0 for premium or unknown
+        users), or None when the balance is too low. Database errors are
+        logged and re-raised: a rename is never let through unmetered.
+        """
+        now = datetime.datetime.now()
+        premium_active = {"$and": [
+            {"$eq": ["$is_premium", True]},
+            {"$or": [
+                {"$eq": [{"$ifNull": ["$premium_expiry", None]}, None]},
+                {"$gt": ["$premium_expiry", now]}
+            ]}
+        ]}
+        try:
+            user = await self.col.find_one_and_update(
+                {"_id": int(user_id), "$or": [
+                    {"is_premium": True, "premium_expiry": None},
+                    {"is_premium": True, "premium_expiry": {"$gt": now}},
+                    {"token": {"$gte": cost}}
+                ]},
+                [{"$set": {"token": {"$cond": [premium_active, "$token", {"$subtract": ["$token", cost]}]}}}],
+                projection={"token": 1, "is_premium": 1, "premium_expiry": 1},
+                return_document=ReturnDocument.AFTER
+            )
+            # Only the refusal path pays for this lookup
+            if user is None:
+                return None if await self._get_user(user_id) else 0
+        except Exception as e:
+            logging.error(f"Error reserving {cost} tokens for user {user_id}: {e}")
+            raise
+        self._cache_update(user_id, {"token": user.get("token", 69)})
+        return 0 if _premium_active(user, now) else cost
+
+    async def refund_tokens(self, user_id, amount):
+        """Give back tokens reserved for jobs that failed"""
+        if amount <= 0:
+            return
+        try:
+            user = await self.col.find_one_and_update(
+                {"_id": int(user_id)},
+                {"$inc": {"token": amount}},
+                projection={"token": 1},
+                return_document=ReturnDocument.AFTER
+            )
+            if user:
+                self._cache_update(user_id, {"token": user["token"]})
+        except Exception as e:
+            logging.error(f"Error refunding {amount} tokens to user {user_id}: {e}")
+
     async def set_media_preference(self, id, media_type):
         try:
             await self.col.update_one(
                 {"_id": int(id)}, {"$set": {"media_type": media_type}}
             )
+            self._cache_update(id, {"media_type": media_type})
         except Exception as e:
             logging.error(f"Error setting media preference for user {id}: {e}")
 
     async def get_media_preference(self, id):
         try:
-            user = await self.col.find_one({"_id": int(id)})
+            user = await self._get_user(id)
             return user.get("media_type", None) if user else None
         except Exception as e:
             logging.error(f"Error getting media preference for user {id}: {e}")
@@ -225,12 +582,13 @@ class Database:
             await self.col.update_one(
                 {"_id": int(id)}, {"$set": {"metadata": metadata}}
             )
+            self._cache_update(id, {"metadata": metadata})
         except Exception as e:
             logging.error(f"Error setting metadata for user {id}: {e}")
 
     async def get_metadata(self, id):
         try:
-            user = await self.col.find_one({"_id": int(id)})
+            user = await self._get_user(id)
             return user.get("metadata", "Off") if user else "Off"
         except Exception as e:
             logging.error(f"Error getting metadata for user {id}: {e}")
@@ -241,12 +599,13 @@ class Database:
             await self.col.update_one(
                 {"_id": int(id)}, {"$set": {"title": title}}
             )
+            self._cache_update(id, {"title": title})
         except Exception as e:
             logging.error(f"Error setting title for user {id}: {e}")
 
     async def get_title(self, id):
         try:
-            user = await self.col.find_one({"_id": int(id)})
+            user = await self._get_user(id)
             return user.get("title", None) if user else None
         except Exception as e:
             logging.error(f"Error getting title for user {id}: {e}")
@@ -257,12 +616,13 @@ class Database:
             await self.col.update_one(
                 {"_id": int(id)}, {"$set": {"author": author}}
             )
+            self._cache_update(id, {"author": author})
         except Exception as e:
             logging.error(f"Error setting author for user {id}: {e}")
 
     async def get_author(self, id):
         try:
-            user = await self.col.find_one({"_id": int(id)})
+            user = await self._get_user(id)
             return user.get("author", None) if user else None
         except Exception as e:
             logging.error(f"Error getting author for user {id}: {e}")
@@ -273,12 +633,13 @@ class Database:
             await self.col.update_one(
                 {"_id": int(id)}, {"$set": {"artist": artist}}
             )
+            self._cache_update(id, {"artist": artist})
         except Exception as e:
             logging.error(f"Error setting artist for user {id}: {e}")
 
     async def get_artist(self, id):
         try:
-            user = await self.col.find_one({"_id": int(id)})
+            user = await self._get_user(id)
             return user.get("artist", None) if user else None
         except Exception as e:
             logging.error(f"Error getting artist for user {id}: {e}")
@@ -289,12 +650,13 @@ class Database:
             await self.col.update_one(
                 {"_id": int(id)}, {"$set": {"audio": audio}}
             )
+            self._cache_update(id, {"audio": audio})
         except Exception as e:
             logging.error(f"Error setting audio for user {id}: {e}")
 
     async def get_audio(self, id):
         try:
-            user = await self.col.find_one({"_id": int(id)})
+            user = await self._get_user(id)
             return user.get("audio", None) if user else None
         except Exception as e:
             logging.error(f"Error getting audio for user {id}: {e}")
@@ -305,12 +667,13 @@ class Database:
             await self.col.update_one(
                 {"_id": int(id)}, {"$set": {"subtitle": subtitle}}
             )
+            self._cache_update(id, {"subtitle": subtitle})
         except Exception as e:
             logging.error(f"Error setting subtitle for user {id}: {e}")
 
     async def get_subtitle(self, id):
         try:
-            user = await self.col.find_one({"_id": int(id)})
+            user = await self._get_user(id)
             return user.get("subtitle", None) if user else None
         except Exception as e:
             logging.error(f"Error getting subtitle for user {id}: {e}")
@@ -321,12 +684,13 @@ class Database:
             await self.col.update_one(
                 {"_id": int(id)}, {"$set": {"video": video}}
             )
+            self._cache_update(id, {"video": video})
         except Exception as e:
             logging.error(f"Error setting video for user {id}: {e}")
 
     async def get_video(self, id):
         try:
-            user = await self.col.find_one({"_id": int(id)})
+            user = await self._get_user(id)
             return user.get("video", None) if user else None
         except Exception as e:
             logging.error(f"Error getting video for user {id}: {e}")
@@ -337,12 +701,13 @@ class Database:
             await self.col.update_one(
                 {"_id": int(id)}, {"$set": {"encoded_by": encoded_by}}
             )
+            self._cache_update(id, {"encoded_by": encoded_by})
         except Exception as e:
             logging.error(f"Error setting encoded_by for user {id}: {e}")
 
     async def get_encoded_by(self, id):
         try:
-            user = await self.col.find_one({"_id": int(id)})
+            user = await self._get_user(id)
             return user.get("encoded_by", None) if user else None
         except Exception as e:
             logging.error(f"Error getting encoded_by for user {id}: {e}")
@@ -353,12 +718,13 @@ class Database:
             await self.col.update_one(
                 {"_id": int(id)}, {"$set": {"custom_tag": custom_tag}}
             )
+            self._cache_update(id, {"custom_tag": custom_tag})
         except Exception as e:
             logging.error(f"Error setting custom_tag for user {id}: {e}")
 
     async def get_custom_tag(self, id):
         try:
-            user = await self.col.find_one({"_id": int(id)})
+            user = await self._get_user(id)
             return user.get("custom_tag", None) if user else None
         except Exception as e:
             logging.error(f"Error getting custom_tag for user {id}: {e}")
@@ -369,12 +735,13 @@ class Database:
             await self.col.update_one(
                 {"_id": int(id)}, {"$set": {"metadata_code": metadata_code}}
             )
+            self._cache_update(id, {"metadata_code": metadata_code})
         except Exception as e:
             logging.error(f"Error setting metadata_code for user {id}: {e}")
 
     async def get_metadata_code(self, id):
         try:
-            user = await self.col.find_one({"_id": int(id)})
+            user = await self._get_user(id)
             return user.get("metadata_code", "Telegram : @DARKXSIDE78") if user else "Telegram : @DARKXSIDE78"
         except Exception as e:
             logging.error(f"Error getting metadata_code for user {id}: {e}")
@@ -385,29 +752,57 @@ class Database:
     async def get_user_settings(self, user_id):
         """Get all user settings in one query"""
         try:
-            user = await self.col.find_one({"_id": int(user_id)})
+            user = await self._get_user(user_id)
             if not user:
                 return self.new_user_settings()
-            
-            # Return all settings with defaults
-            return {
-                'upload_mode': user.get('upload_mode', 'Telegram'),
-                'send_as': user.get('send_as', 'DOCUMENT'),
-                'upload_destination': user.get('upload_destination', None),
-                'custom_thumbnail': user.get('file_id', None),
-                'prefix': user.get('prefix', None),
-                'suffix': user.get('suffix', None),
-                'rename_mode': user.get('rename_mode', 'Auto'),
-                'remove_words': user.get('remove_words', None),
-                'sample_video': user.get('sample_video', False),
-                'screenshot_enabled': user.get('screenshot_enabled', False),
-                'ai_autorename': user.get('ai_autorename', False),
-                'manual_mode': user.get('manual_mode', False)
-            }
+            return self._settings_from_user(user)
         except Exception as e:
             logging.error(f"Error getting user settings: {e}")
             return self.new_user_settings()
 
+    @staticmethod
+    def _settings_from_user(user):
+        """Build the settings dict from a user document, with defaults"""
+        return {
+            'upload_mode': user.get('upload_mode', 'Telegram'),
+            'send_as': user.get('send_as', 'DOCUMENT'),
+            'upload_destination': user.get('upload_destination', None),
+            'custom_thumbnail': user.get('file_id', None),
+            'prefix': user.get('prefix', None),
+            'suffix': user.get('suffix', None),
+            'rename_mode': user.get('rename_mode', 'Auto'),
+            'remove_words': user.get('remove_words', None),
+            'sample_video': user.get('sample_video', False),
+            'screenshot_enabled': user.get('screenshot_enabled', False),
+            'ai_autorename': user.get('ai_autorename', False),
+            'manual_mode': user.get('manual_mode', False)
+        }
+
+    async def get_rename_context(self, user_id):
+        """Get everything the rename pipeline needs in one projected query"""
+        try:
+            user = await self._get_user(user_id, RENAME_CONTEXT_FIELDS)
+        except Exception as e:
+            logging.error(f"Error getting rename context for user {user_id}: {e}")
+            user = None
+        if not user:
+            user = self.new_user(user_id)
+
+        premium_expiry = user.get('premium_expiry')
+        is_premium = _premium_active(user, datetime.datetime.now())
+        return {
+            'settings': self._settings_from_user(user),
+            'thumbnail': user.get('file_id', None),
+            'caption': user.get('caption', None),
+            'format_template': user.get('format_template', None),
+            'media_type': user.get('media_type', None),
+            'metadata': user.get('metadata', 'Off'),
+            'metadata_fields': {field: user.get(field, None) for field in METADATA_FIELDS},
+            'is_premium': is_premium,
+            'premium_expiry': premium_expiry,
+            'token': user.get('token', 69)
+        }
+
     def new_user_settings(self):
         """Default settings for new users"""
         return {
@@ -432,6 +827,7 @@ class Database:
                 {"_id": int(user_id)},
                 {"$set": {setting_key: value}}
             )
+            self._cache_update(user_id, {setting_key: value})
             return True
         except Exception as e:
             logging.error(f"Error updating setting {setting_key}: {e}")
@@ -444,7 +840,7 @@ class Database:
     async def get_prefix(self, user_id):
         """Get filename prefix"""
         try:
-            user = await self.col.find_one({"_id": int(user_id)})
+            user = await self._get_user(user_id)
             return user.get('prefix', None) if user else None
         except Exception as e:
             logging.error(f"Error getting prefix: {e}")
@@ -457,7 +853,7 @@ class Database:
     async def get_suffix(self, user_id):
         """Get filename suffix"""
         try:
-            user = await self.col.find_one({"_id": int(user_id)})
+            user = await self._get_user(user_id)
             return user.get('suffix', None) if user else None
         except Exception as e:
             logging.error(f"Error getting suffix: {e}")
@@ -470,7 +866,7 @@ class Database:
     async def get_upload_destination(self, user_id):
         """Get upload destination"""
         try:
-            user = await self.col.find_one({"_id": int(user_id)})
+            user = await self._get_user(user_id)
             return user.get('upload_destination', None) if user else None
         except Exception as e:
             logging.error(f"Error getting upload destination: {e}")
@@ -483,7 +879,7 @@ class Database:
     async def get_remove_words(self, user_id):
         """Get words to remove from filenames"""
         try:
-            user = await self.col.find_one({"_id": int(user_id)})
+            user = await self._get_user(user_id)
             return user.get('remove_words', None) if user else None
         except Exception as e:
             logging.error(f"Error getting remove words: {e}")
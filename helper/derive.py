@@ -0,0 +1,60 @@
+import asyncio
+import logging
+import os
+import shutil
+from pyrogram.types import InputMediaPhoto
+from config import Config
+from helper.ffmpeg import VIDEO_EXTENSIONS, probe_duration, generate_sample, generate_screenshots
+
+
+def wants_derived_media(message, file_path, settings):
+    """True if the user asked for a sample or screenshots and this is a video"""
+    if not (settings.get('sample_video') or settings.get('screenshot_enabled')):
+        return False
+    return bool(message.video) or file_path.lower().endswith(VIDEO_EXTENSIONS)
+
+
+async def send_derived_media(client, message, file_path, settings):
+    """Send a sample clip and/or a screenshot album for a downloaded video.
+
+    Meant to run as a task next to the main upload; it only reads
+    `file_path`, so the caller must keep the file until this finishes.
+    """
+    work_dir = os.path.join(os.path.dirname(file_path), f".derive_{message.chat.id}_{message.id}")
+    os.makedirs(work_dir, exist_ok=True)
+    try:
+        duration = message.video.duration if message.video and message.video.duration else 0
+        if not duration:
+            duration = await probe_duration(file_path)
+
+        jobs = []
+        if settings.get('sample_video'):
+            sample_path = os.path.join(work_dir, f"sample{os.path.splitext(file_path)[1] or '.mkv'}")
+            jobs.append(generate_sample(file_path, sample_path, duration, Config.SAMPLE_DURATION))
+        if settings.get('screenshot_enabled'):
+            jobs.append(generate_screenshots(file_path, work_dir, duration, Config.SCREENSHOT_COUNT))
+        results = await asyncio.gather(*jobs)
+
+        if settings.get('sample_video'):
+            sample_path = results.pop(0)
+            if sample_path:
+                await client.send_video(
+                    chat_id=message.chat.id,
+                    video=sample_path,
+                    caption=f"🎞️ **Sample Video** ({Config.SAMPLE_DURATION}s)",
+                    supports_streaming=True,
+                    reply_to_message_id=message.id
+                )
+        if settings.get('screenshot_enabled'):
+            screenshots = results.pop(0)
+            if screenshots:
+                # Telegram albums hold at most 10 items
+                await client.send_media_group(
+                    chat_id=message.chat.id,
+                    media=[InputMediaPhoto(path) for path in screenshots[:10]],
+                    reply_to_message_id=message.id
+                )
+    except Exception as e:
+        logging.error(f"Sample/screenshot error: {e}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
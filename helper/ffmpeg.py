@@ -0,0 +1,194 @@
+import asyncio
+import logging
+import os
+from config import Config
+
+# Containers ffmpeg can stream-copy into while rewriting tags
+METADATA_EXTENSIONS = (
+    '.mkv', '.mp4', '.m4v', '.mov', '.webm', '.avi',
+    '.mp3', '.m4a', '.flac', '.ogg', '.opus'
+)
+# Treated as video everywhere: samples/screenshots and sending as media
+VIDEO_EXTENSIONS = ('.mp4', '.mkv', '.avi', '.mov', '.webm', '.m4v', '.wmv', '.flv')
+
+# Caps the number of ffmpeg/ffprobe processes running at once
+_ffmpeg_slots = asyncio.Semaphore(Config.FFMPEG_WORKERS)
+
+
+async def run_ffmpeg(*args, binary="ffmpeg"):
+    """Run ffmpeg/ffprobe in a subprocess without blocking the event loop.
+
+    Returns (returncode, stdout, stderr).
+    """
+    async with _ffmpeg_slots:
+        process = await asyncio.create_subprocess_exec(
+            binary, *args,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        try:
+            stdout, stderr = await process.communicate()
+        except asyncio.CancelledError:
+            # Cancelled jobs mustn't leave ffmpeg running on a file being removed
+            process.kill()
+            await process.wait()
+            raise
+        return process.returncode, stdout, stderr
+
+
+def build_metadata_args(fields):
+    """ffmpeg -metadata arguments for the user's stored tags"""
+    container = {
+        'title': fields.get('title'),
+        'author': fields.get('author'),
+        'artist': fields.get('artist'),
+        'encoded_by': fields.get('encoded_by'),
+        'comment': fields.get('custom_tag')
+    }
+    streams = {
+        's:v': fields.get('video'),
+        's:a': fields.get('audio'),
+        's:s': fields.get('subtitle')
+    }
+
+    args = []
+    for key, value in container.items():
+        if value:
+            args += ['-metadata', f'{key}={value}']
+    for specifier, value in streams.items():
+        if value:
+            args += [f'-metadata:{specifier}', f'title={value}']
+    return args
+
+
+async def add_metadata(file_path, fields):
+    """Write the user's metadata into a file in place.
+
+    Remuxes with `-c copy`, so no stream is re-encoded and the cost is
+    about one sequential read and write of the file. Returns True on
+    success; on failure the original file is left untouched.
+    """
+    if not file_path.lower().endswith(METADATA_EXTENSIONS):
+        return False
+
+    directory, name = os.path.split(file_path)
+    temp_path = os.path.join(directory, f".meta_{name}")
+    args = [
+        '-hide_banner', '-loglevel', 'error', '-y',
+        '-i', file_path,
+        '-map', '0', '-ignore_unknown',
+        '-c', 'copy',
+        '-map_metadata', '0',
+        *build_metadata_args(fields),
+        temp_path
+    ]
+
+    try:
+        returncode, _, stderr = await run_ffmpeg(*args)
+        if returncode != 0:
+            logging.error(f"Metadata remux failed for {name}: {stderr.decode(errors='ignore').strip()}")
+            return False
+        os.replace(temp_path, file_path)
+        return True
+    except Exception as e:
+        logging.error(f"Metadata remux error for {name}: {e}")
+        return False
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+async def probe_duration(file_path):
+    """Container duration in seconds via ffprobe, or 0 if unknown"""
+    try:
+        returncode, stdout, _ = await run_ffmpeg(
+            '-v', 'error', '-show_entries', 'format=duration',
+            '-of', 'default=noprint_wrappers=1:nokey=1', file_path,
+            binary="ffprobe"
+        )
+        if returncode != 0:
+            return 0
+        return float(stdout.decode().strip() or 0)
+    except Exception as e:
+        logging.error(f"ffprobe error for {file_path}: {e}")
+        return 0
+
+
+async def probe_media(file_path):
+    """Duration (seconds), width and height of the first video stream.
+
+    One ffprobe run for all three; missing values come back as 0.
+    """
+    info = {'duration': 0, 'width': 0, 'height': 0}
+    try:
+        returncode, stdout, _ = await run_ffmpeg(
+            '-v', 'error', '-select_streams', 'v:0',
+            '-show_entries', 'stream=width,height:format=duration',
+            '-of', 'default=noprint_wrappers=1', file_path,
+            binary="ffprobe"
+        )
+        if returncode != 0:
+            return info
+        for line in stdout.decode(errors='ignore').splitlines():
+            key, _, value = line.partition('=')
+            if key in info:
+                try:
+                    info[key] = float(value) if key == 'duration' else int(value)
+                except ValueError:
+                    pass
+    except Exception as e:
+        logging.error(f"ffprobe error for {file_path}: {e}")
+    return info
+
+
+async def generate_sample(file_path, output_path, duration, sample_seconds):
+    """Cut a sample clip starting about a third into the file.
+
+    `-ss` before `-i` seeks in the demuxer and `-c copy` skips decoding,
+    so this only reads the bytes of the clip, whatever the file size.
+    """
+    sample_seconds = min(sample_seconds, duration) if duration else sample_seconds
+    start = max(0, min(duration * 0.3, duration - sample_seconds)) if duration else 0
+    returncode, _, stderr = await run_ffmpeg(
+        '-hide_banner', '-loglevel', 'error', '-y',
+        '-ss', f'{start:.2f}', '-i', file_path,
+        '-t', f'{sample_seconds:.2f}',
+        '-map', '0:v:0', '-map', '0:a:0?',
+        '-c', 'copy', '-avoid_negative_ts', 'make_zero',
+        output_path
+    )
+    if returncode != 0:
+        logging.error(f"Sample generation failed: {stderr.decode(errors='ignore').strip()}")
+        return None
+    return output_path
+
+
+async def generate_screenshots(file_path, output_dir, duration, count):
+    """Grab `count` evenly spaced frames as JPEGs.
+
+    Each frame is its own input-seeked ffmpeg run that decodes a single
+    frame, and the runs go through the shared process cap in parallel.
+    """
+    if not duration or count <= 0:
+        return []
+
+    results = await asyncio.gather(*(
+        extract_frame(
+            file_path,
+            os.path.join(output_dir, f"screenshot_{index + 1:02d}.jpg"),
+            duration * (index + 1) / (count + 1)
+        )
+        for index in range(count)
+    ))
+    return [path for path in results if path]
+
+
+async def extract_frame(file_path, output_path, timestamp):
+    """Decode a single frame at `timestamp` (input-seeked) into a JPEG"""
+    returncode, _, _ = await run_ffmpeg(
+        '-hide_banner', '-loglevel', 'error', '-y',
+        '-ss', f'{timestamp:.2f}', '-i', file_path,
+        '-frames:v', '1', '-q:v', '2',
+        output_path
+    )
+    return output_path if returncode == 0 and os.path.exists(output_path) else None
@@ -0,0 +1,50 @@
+from config import Config
+from helper.database import DARKXSIDE78
+
+NO_TOKENS_TEXT = (
+    "❌ **Not Enough Tokens**\n\n"
+    "This needs **{needed}** token(s). Check your balance with /token "
+    "and get more with /gentoken."
+)
+RESERVE_FAILED_TEXT = "❌ **Couldn't check your token balance.** Please try again in a moment."
+
+
+class TokenReservation:
+    """Tokens taken up front for `files` renames, refundable per failed file"""
+
+    def __init__(self, user_id, files, charged):
+        self.user_id = user_id
+        self.files = files
+        self.charged = charged
+        self.refunded = 0
+
+    async def refund(self, files=1):
+        """Return the tokens of `files` renames that didn't go through"""
+        files = min(files, self.files - self.refunded)
+        if files <= 0 or not self.charged:
+            return
+        self.refunded += files
+        await DARKXSIDE78.refund_tokens(self.user_id, self.charged // self.files * files)
+
+
+async def reserve_renames(message, files=1, notify=None):
+    """Charge the user for `files` renames before any download starts.
+
+    Returns a TokenReservation, or None after telling the user (by
+    editing `notify`, else replying to `message`) that they're short or
+    that the balance couldn't be checked.
+    """
+    user_id = message.from_user.id
+    needed = files * Config.RENAME_TOKEN_COST
+    try:
+        charged = await DARKXSIDE78.reserve_tokens(user_id, needed)
+        text = NO_TOKENS_TEXT.format(needed=needed)
+    except Exception:
+        charged, text = None, RESERVE_FAILED_TEXT
+    if charged is None:
+        if notify is not None:
+            await notify.edit_text(text)
+        else:
+            await message.reply_text(text)
+        return None
+    return TokenReservation(user_id, files, charged)
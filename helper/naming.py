@@ -0,0 +1,348 @@
+import logging
+import os
+import re
+from functools import lru_cache
+import regex
+from string import Formatter
+
+RENAME_FIELDS = ('title', 'season', 'episode', 'quality', 'audio')
+
+# Tried in order, first hit wins. Combined season/episode forms come first
+# so "S01E05" isn't read as a lone "E05" with no season.
+_SEASON_EPISODE_PATTERNS = (
+    # Optional second episode: "S01E01E02", "S01E01-E02", "S01E01-02"
+    re.compile(
+        r'\bS(\d{1,2})[\s._-]*E(\d{1,4})(?:v\d)?'
+        r'(?:(?:[\s._]*-[\s._]*E?|E)(\d{1,4})(?:v\d)?)?\b',
+        re.IGNORECASE
+    ),
+    re.compile(r'\b(\d{1,2})x(\d{1,4})\b'),
+    re.compile(r'\bSeason[\s._-]*(\d{1,2})[\s._-]*(?:Episode|Ep)[\s._-]*(\d{1,4})\b', re.IGNORECASE),
+)
+_SEASON_PATTERNS = (
+    re.compile(r'\bSeason[\s._-]*(\d{1,2})\b', re.IGNORECASE),
+    re.compile(r'\bS(\d{1,2})\b', re.IGNORECASE),
+)
+_EPISODE_PATTERNS = (
+    re.compile(r'\b(?:Episode|Ep|E)[\s._-]*(\d{1,4})(?:v\d)?\b', re.IGNORECASE),
+    # Fansub style: "Show - 05 [1080p]" / "Show - 05v2.mkv"; bare numbers
+    # that look like a year ("Movie (2019)") aren't episodes
+    re.compile(r'\s-\s(?!(?:19|20)\d\d\b)(\d{1,4})(?:v\d)?(?=[\s._\[\(]|$)'),
+    re.compile(r'[\[\(](?!(?:19|20)\d\d[\]\)])(\d{1,4})(?:v\d)?[\]\)]'),
+)
+_QUALITY_PATTERNS = (
+    # Also after a count, as in "4x1080p" batch tags
+    re.compile(r'(?:\b|(?<=\dx))(2160|1440|1080|720|576|480|360|240)[pi]\b', re.IGNORECASE),
+    re.compile(r'\b(4K|UHD|FHD|HD|SD)\b', re.IGNORECASE),
+    re.compile(r'\b(\d{3,4})x(\d{3,4})\b'),
+)
+_AUDIO_PATTERN = re.compile(
+    r'\b(Dual[\s._-]?Audio|Multi[\s._-]?Audio|Tri[\s._-]?Audio'
+    r'|Hindi|English|Japanese|Tamil|Telugu|Korean|Dubbed|Dub'
+    r'|AAC(?:[\s.]?[257][\s.][01])?|DDP?(?:[\s.]?[257][\s.][01])?|E-?AC-?3|AC3|DTS(?:-HD)?|TrueHD|Atmos|FLAC|Opus)\b',
+    re.IGNORECASE
+)
+_GROUP_TAG = re.compile(r'^\s*[\[\(][^\]\)]*[\]\)]\s*')
+_SEPARATORS = re.compile(r'[._]+')
+_SPACES = re.compile(r'\s{2,}')
+_CHANNELS = re.compile(r'(\d)\s(\d)')
+_TITLE_TRAIL = re.compile(r'[\s\-\[\(]+$')
+# Left over when a template field had no value: "[]", "()", dangling dashes
+_EMPTY_GROUPS = re.compile(r'\[\s*\]|\(\s*\)|\{\s*\}')
+_DANGLING = re.compile(r'(?:\s+[-_.|])+(?=\s|$)|^[\s\-_.|]+')
+# What a missing field takes with it: the word glued to its left ("S" in
+# "S{season}") and the closing brackets right after it
+_ATTACHED_PREFIX = re.compile(r'[^\s\]\)\}]+$')
+_ATTACHED_SUFFIX = re.compile(r'^[\]\)\}]+')
+_UNSAFE = re.compile(r'[\\/:*?"<>|]')
+_QUALITY_LABELS = {'4K': '2160p', 'UHD': '2160p', 'FHD': '1080p', 'HD': '720p', 'SD': '480p'}
+# A quantified group that itself contains a quantifier, e.g. (a+)+ or (\w*x)*:
+# the classic shape of catastrophic backtracking
+_NESTED_QUANTIFIER = re.compile(r'\((?:[^()\\]|\\.)*[+*}](?:[^()\\]|\\.)*\)[+*{]')
+MAX_RULE_PATTERN = 200
+# Seconds one pass of a user's rules may take before its regex rules are dropped
+RULE_TIMEOUT = 0.05
+
+
+def _search(patterns, text):
+    for pattern in patterns:
+        match = pattern.search(text)
+        if match:
+            return match
+    return None
+
+
+def episode_number(episode):
+    """First episode of a parsed episode field ("01-02" -> 1), 0 if there is none"""
+    match = re.match(r'\d+', episode or '')
+    return int(match.group()) if match else 0
+
+
+def parse_release_name(filename):
+    """Pull title, season, episode, quality and audio out of a release name.
+
+    Missing fields come back as ''. Numbers are returned zero-padded to two
+    digits ("5" -> "05"), and an episode without a season is season 01.
+    Multi-episode releases give a range: "S01E01E02" -> episode "01-02".
+    """
+    name = os.path.splitext(filename)[0]
+    # Release group tags ("[SubsPlease] ...") lead but aren't the title
+    text = _GROUP_TAG.sub('', name)
+    text = _SEPARATORS.sub(' ', text)
+    info = dict.fromkeys(RENAME_FIELDS, '')
+    cut = len(text)
+
+    match = _search(_SEASON_EPISODE_PATTERNS, text)
+    if match:
+        info['season'] = f"{int(match.group(1)):02d}"
+        info['episode'] = f"{int(match.group(2)):02d}"
+        last = match.group(3) if match.re is _SEASON_EPISODE_PATTERNS[0] else None
+        if last and int(last) > int(match.group(2)):
+            info['episode'] += f"-{int(last):02d}"
+        cut = match.start()
+    else:
+        season = _search(_SEASON_PATTERNS, text)
+        if season:
+            info['season'] = f"{int(season.group(1)):02d}"
+            cut = min(cut, season.start())
+        episode = _search(_EPISODE_PATTERNS, text)
+        if episode:
+            info['episode'] = f"{int(episode.group(1)):02d}"
+            cut = min(cut, episode.start())
+            # Bare episode numbers are almost always a first (only) season
+            info['season'] = info['season'] or '01'
+
+    quality = _search(_QUALITY_PATTERNS, text)
+    if quality:
+        if quality.re is _QUALITY_PATTERNS[2]:
+            info['quality'] = f"{quality.group(2)}p"
+        else:
+            label = quality.group(1).upper()
+            info['quality'] = _QUALITY_LABELS.get(label, f"{label}p")
+        cut = min(cut, quality.start())
+
+    audio = _AUDIO_PATTERN.search(text)
+    if audio:
+        info['audio'] = _CHANNELS.sub(r'\1.\2', audio.group(1))
+        cut = min(cut, audio.start())
+
+    info['title'] = _TITLE_TRAIL.sub('', text[:cut]).strip() or text.strip()
+    return info
+
+
+class CompiledTemplate:
+    """A template split once into literal text and known placeholders"""
+
+    __slots__ = ('parts', 'fields')
+
+    def __init__(self, parts):
+        self.parts = parts
+        self.fields = frozenset(field for literal, field in parts if field)
+
+    def render(self, values, drop_empty=False):
+        """Fill in `values`; with `drop_empty`, text glued to an empty field goes too"""
+        if not drop_empty:
+            return ''.join(
+                literal + (values.get(field, '') if field else '')
+                for literal, field in self.parts
+            )
+        out = []
+        after_empty = False
+        for literal, field in self.parts:
+            if after_empty:
+                literal = _ATTACHED_SUFFIX.sub('', literal)
+            value = values.get(field, '') if field else ''
+            after_empty = bool(field) and not value
+            if after_empty:
+                literal = _ATTACHED_PREFIX.sub('', literal)
+            out.append(literal + value)
+        return ''.join(out)
+
+
+@lru_cache(maxsize=1024)
+def compile_template(template, fields):
+    """Parse `template` once into a CompiledTemplate, cached per string.
+
+    Only placeholders listed in `fields` are substituted. Unknown ones and
+    stray braces stay as literal text, so a typo never fails an upload.
+    """
+    try:
+        parsed = list(Formatter().parse(template))
+    except ValueError:
+        return CompiledTemplate(((template, None),))
+
+    parts = []
+    for literal, field, spec, conversion in parsed:
+        if field is None:
+            parts.append((literal, None))
+        elif field.lower() in fields:
+            parts.append((literal, field.lower()))
+        else:
+            raw = field + (f"!{conversion}" if conversion else "") + (f":{spec}" if spec else "")
+            parts.append((literal + "{" + raw + "}", None))
+    return CompiledTemplate(tuple(parts))
+
+
+def format_filename(template, filename):
+    """Build a new filename from the user's format template.
+
+    Keeps the original extension. Fields the filename didn't contain are
+    dropped with the text glued to them ("S{season}" -> ""), then the
+    brackets and separators left empty are tidied.
+    """
+    compiled = compile_template(template, RENAME_FIELDS)
+    ext = os.path.splitext(filename)[1]
+    name = compiled.render(parse_release_name(filename) if compiled.fields else {}, drop_empty=True)
+    name = _UNSAFE.sub('', name)
+    name = _EMPTY_GROUPS.sub('', name)
+    name = _DANGLING.sub('', name)
+    name = _SPACES.sub(' ', name).strip()
+    return f"{name}{ext}" if name else filename
+
+
+class RuleSet:
+    """A user's remove/replace spec compiled into a single matcher.
+
+    All rules share one alternation regex, so applying 50 rules costs one
+    left-to-right pass over the name instead of one pass per rule.
+    Literal rules are tried longest first, which makes overlapping rules
+    ("Season", "Sea") resolve to the longer match. A pass is capped at
+    RULE_TIMEOUT; regex rules that blow it are dropped for good and the
+    pass is retried once.
+    """
+
+    __slots__ = ('literals', 'regexes', 'pattern', 'replacements')
+
+    def __init__(self, literals, regexes):
+        self.literals = literals
+        self.regexes = regexes
+        self._build()
+
+    def _build(self):
+        alternatives = []
+        self.replacements = {}
+        for index, find in enumerate(sorted(self.literals, key=len, reverse=True)):
+            alternatives.append(f"(?P<l{index}>{regex.escape(find)})")
+            self.replacements[f"l{index}"] = self.literals[find]
+        for index, (find, replace) in enumerate(self.regexes):
+            alternatives.append(f"(?P<r{index}>{find})")
+            self.replacements[f"r{index}"] = replace
+        self.pattern = regex.compile('|'.join(alternatives)) if alternatives else None
+
+    def apply(self, text):
+        if self.pattern is None:
+            return text
+        try:
+            return self._sub(text, RULE_TIMEOUT)
+        except TimeoutError:
+            self._drop_slow_regexes(text)
+        if self.pattern is None:
+            return text
+        if self.regexes:
+            try:
+                return self._sub(text, RULE_TIMEOUT)
+            except TimeoutError:
+                logging.warning("Rename rules timed out twice, leaving the name unchanged")
+                return text
+        # Literals only: linear in the name, so no cap is needed
+        return self._sub(text, None)
+
+    def _sub(self, text, timeout):
+        return self.pattern.sub(lambda m: self.replacements[m.lastgroup], text, timeout=timeout)
+
+    def _drop_slow_regexes(self, text):
+        kept = []
+        for find, replace in self.regexes:
+            try:
+                regex.compile(find).search(text, timeout=RULE_TIMEOUT)
+                kept.append((find, replace))
+            except TimeoutError:
+                logging.warning(f"Dropping rename rule that timed out: {find!r}")
+        if len(kept) == len(self.regexes):
+            # Only slow in combination; literal rules alone are linear
+            logging.warning("Dropping all regex rename rules after a timeout")
+            kept = []
+        self.regexes = kept
+        self._build()
+
+
+def _split_rules(spec):
+    """Split a spec on `|`, except inside `/pattern/` rules.
+
+    A rule starting with `/` runs to the first unescaped `/` followed by
+    the end, `|` or `:replace`, so alternations like `/(?:720p|1080p)/`
+    stay whole.
+    """
+    rules = []
+    i = 0
+    while i < len(spec):
+        end = -1
+        if spec[i] == '/':
+            j = i + 1
+            while j < len(spec):
+                if spec[j] == '\\':
+                    j += 2
+                    continue
+                if spec[j] == '/' and (j + 1 == len(spec) or spec[j + 1] in '|:'):
+                    end = spec.find('|', j)
+                    break
+                j += 1
+            else:
+                end = spec.find('|', i)
+        else:
+            end = spec.find('|', i)
+        if end < 0:
+            end = len(spec)
+        rules.append(spec[i:end])
+        i = end + 1
+    return rules
+
+
+def _parse_rule(rule):
+    """(find, replace, is_regex) for one `|`-separated rule.
+
+    `find:replace` and bare `find` (remove) are literal. `/pattern/` or
+    `/pattern/:replace` is a regular expression.
+    """
+    if rule.startswith('/'):
+        end = rule.rfind('/')
+        if end > 0 and (end == len(rule) - 1 or rule[end + 1] == ':'):
+            return rule[1:end], rule[end + 2:], True
+    find, _, replace = rule.partition(':')
+    return find, replace, False
+
+
+def _safe_regex(pattern):
+    if len(pattern) > MAX_RULE_PATTERN or _NESTED_QUANTIFIER.search(pattern):
+        return False
+    try:
+        compiled = regex.compile(pattern)
+    except regex.error:
+        return False
+    # Inner groups would shift the combined pattern's group numbering
+    return compiled.groups == 0 and not compiled.match('')
+
+
+@lru_cache(maxsize=512)
+def compile_rules(spec):
+    """Compile a remove/replace spec ("find:replace|word|/regex/:x"), cached per spec.
+
+    Regex rules with obviously nested quantifiers, groups, or an empty
+    match are skipped with a warning; anything slow that gets past that
+    is caught by the per-pass timeout in RuleSet.apply.
+    """
+    literals = {}
+    regexes = []
+    for rule in _split_rules(spec):
+        if not rule:
+            continue
+        find, replace, is_regex = _parse_rule(rule)
+        if not find:
+            continue
+        if not is_regex:
+            literals.setdefault(find, replace)
+        elif _safe_regex(find):
+            regexes.append((find, replace))
+        else:
+            logging.warning(f"Skipping unsafe or invalid rename rule: {find!r}")
+    return RuleSet(literals, regexes)
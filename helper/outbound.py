@@ -0,0 +1,298 @@
+import asyncio
+import contextvars
+import logging
+import time
+from collections import deque
+from pyrogram import raw
+from pyrogram.errors import FloodWait
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Lower runs first: deliver files, then messages, then cosmetic edits/deletes,
+# and broadcast copies only when nothing else is ready
+PRIORITY_UPLOAD = 0
+PRIORITY_MESSAGE = 1
+PRIORITY_EDIT = 2
+PRIORITY_BROADCAST = 3
+_PRIORITIES = (PRIORITY_UPLOAD, PRIORITY_MESSAGE, PRIORITY_EDIT, PRIORITY_BROADCAST)
+
+# True while a broadcast is sending: its calls go to the broadcast lane
+broadcasting = contextvars.ContextVar('broadcasting', default=False)
+
+_UPLOADS = (
+    raw.functions.messages.SendMedia,
+    raw.functions.messages.SendMultiMedia,
+    raw.functions.messages.ForwardMessages,
+)
+_MESSAGES = (raw.functions.messages.SendMessage,)
+_EDITS = (raw.functions.messages.EditMessage,)
+_DELETES = (raw.functions.messages.DeleteMessages, raw.functions.channels.DeleteMessages)
+
+
+class TokenBucket:
+    """Shared send rate limiter: `rate` tokens per second, bursts up to `capacity`.
+
+    A FloodWait from any sender `pause`s the whole bucket, so every sender
+    backs off together instead of each hitting the limit in turn.
+    `throttle` halves the rate instead (down to an eighth), and every
+    `recover` wins a little of it back.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.base_rate = rate
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, seconds):
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0
+
+    def paused_for(self):
+        """Seconds until a pause ends (0 if not paused)"""
+        return max(0, self._paused_until - time.monotonic())
+
+    def throttle(self):
+        self.rate = max(self.base_rate / 8, self.rate / 2)
+
+    def recover(self):
+        self.rate = min(self.base_rate, self.rate * 1.02)
+
+
+def _peer_key(peer):
+    for attr in ('user_id', 'chat_id', 'channel_id'):
+        value = getattr(peer, attr, None)
+        if value is not None:
+            return value
+    return None
+
+
+def _edit_kind(query):
+    # One EditMessage carries text, media or only a keyboard; leaving a
+    # part out clears it, so only edits of the same kind may replace each other
+    if query.media is not None:
+        return 'media'
+    if query.message is not None:
+        return 'text'
+    return 'markup'
+
+
+def classify(query):
+    """(priority, chat, merge_key) for calls that send to a chat, else None"""
+    if isinstance(query, _UPLOADS):
+        return PRIORITY_UPLOAD, _peer_key(getattr(query, 'peer', None) or getattr(query, 'to_peer', None)), None
+    if isinstance(query, _MESSAGES):
+        return PRIORITY_MESSAGE, _peer_key(query.peer), None
+    if isinstance(query, _EDITS):
+        chat = _peer_key(query.peer)
+        return PRIORITY_EDIT, chat, ('edit', chat, query.id, _edit_kind(query))
+    if isinstance(query, _DELETES):
+        return PRIORITY_EDIT, _peer_key(getattr(query, 'channel', None)), None
+    return None
+
+
+class _Call:
+    __slots__ = ('priority', 'chat', 'merge_key', 'invoke', 'args', 'kwargs', 'future', 'attempts')
+
+    def __init__(self, priority, chat, merge_key, invoke, args, kwargs, future):
+        self.priority = priority
+        self.chat = chat
+        self.merge_key = merge_key
+        self.invoke = invoke
+        self.args = args
+        self.kwargs = kwargs
+        self.future = future
+        self.attempts = 0
+
+
+class OutboundScheduler:
+    """Single funnel for calls that post into chats.
+
+    Every send/edit/delete waits for the global budget and its chat's
+    budget, and queued calls go out by priority (uploads, then messages,
+    then edits, then broadcast copies). A newer edit of a message that's
+    still queued replaces an older one of the same kind (text, media or
+    keyboard) and both callers get its result. FloodWait is handled
+    here: the chat is paused and the global rate halved (for unknown
+    chats, every chat is paused), the call is re-queued, and the event is recorded for /stats. Callers only
+    see FloodWait when the wait exceeds OUTBOUND_MAX_WAIT.
+    """
+
+    def __init__(self, global_rate, chat_rate, chat_burst, workers):
+        self.global_bucket = TokenBucket(global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.workers = workers
+        self._queues = {priority: deque() for priority in _PRIORITIES}
+        self._edits = {}
+        self._chat_tokens = {}
+        self._chat_paused = {}
+        self._changed = None
+        self._tasks = []
+        self.flood_waits = deque(maxlen=200)
+        self.merged = 0
+
+    async def invoke(self, invoke, query, *args, **kwargs):
+        kind = classify(query)
+        if kind is None:
+            return await invoke(query, *args, **kwargs)
+        self._ensure_workers()
+
+        priority, chat, merge_key = kind
+        if broadcasting.get():
+            priority, merge_key = PRIORITY_BROADCAST, None
+        # FloodWait must reach us instead of being slept through inside pyrogram
+        kwargs['sleep_threshold'] = 0
+        if merge_key is not None:
+            pending = self._edits.get(merge_key)
+            if pending is not None:
+                # Still queued: send the newer text instead, once
+                pending.args = (query,) + args
+                pending.kwargs = kwargs
+                self.merged += 1
+                return await asyncio.shield(pending.future)
+
+        call = _Call(
+            priority, chat, merge_key, invoke,
+            (query,) + args, kwargs, asyncio.get_running_loop().create_future()
+        )
+        self._enqueue(call)
+        return await asyncio.shield(call.future)
+
+    def stats(self):
+        """Queue depth and recent FloodWait counts"""
+        hour_ago = time.time() - 3600
+        recent = [seconds for at, seconds, _ in self.flood_waits if at > hour_ago]
+        return {
+            'queued': sum(len(q) for q in self._queues.values()),
+            'queued_broadcast': len(self._queues[PRIORITY_BROADCAST]),
+            'merged_edits': self.merged,
+            'flood_waits_1h': len(recent),
+            'flood_wait_seconds_1h': sum(recent)
+        }
+
+    def _ensure_workers(self):
+        if self._tasks:
+            return
+        self._changed = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    def _enqueue(self, call, front=False):
+        if front:
+            self._queues[call.priority].appendleft(call)
+        else:
+            self._queues[call.priority].append(call)
+        if call.merge_key is not None:
+            self._edits[call.merge_key] = call
+        self._changed.set()
+
+    def _chat_ready_in(self, chat, now):
+        """Seconds until `chat` may receive another call (0 = now)"""
+        if chat is None:
+            return 0
+        paused = self._chat_paused.get(chat, 0) - now
+        tokens, updated = self._chat_tokens.get(chat, (self.chat_burst, now))
+        tokens = min(self.chat_burst, tokens + (now - updated) * self.chat_rate)
+        wait = 0 if tokens >= 1 else (1 - tokens) / self.chat_rate
+        return max(paused, wait, 0)
+
+    def _take_chat_token(self, chat, now):
+        if chat is None:
+            return
+        tokens, updated = self._chat_tokens.get(chat, (self.chat_burst, now))
+        tokens = min(self.chat_burst, tokens + (now - updated) * self.chat_rate)
+        self._chat_tokens[chat] = (tokens - 1, now)
+        if len(self._chat_tokens) > 10000:
+            # Chats idle long enough to be back at a full burst need no entry
+            full = [c for c, (t, u) in self._chat_tokens.items() if t + (now - u) * self.chat_rate >= self.chat_burst]
+            for c in full:
+                del self._chat_tokens[c]
+
+    def _next_call(self):
+        """Pop the first call whose chat is ready, by priority; else seconds to wait"""
+        now = time.monotonic()
+        soonest = None
+        for priority in _PRIORITIES:
+            queue = self._queues[priority]
+            for call in queue:
+                wait = self._chat_ready_in(call.chat, now)
+                if wait <= 0:
+                    queue.remove(call)
+                    if call.merge_key is not None and self._edits.get(call.merge_key) is call:
+                        del self._edits[call.merge_key]
+                    self._take_chat_token(call.chat, now)
+                    return call, None
+                soonest = wait if soonest is None else min(soonest, wait)
+        return None, soonest
+
+    async def _worker(self):
+        while True:
+            call, wait = self._next_call()
+            if call is None:
+                self._changed.clear()
+                try:
+                    await asyncio.wait_for(self._changed.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            await self.global_bucket.acquire()
+            call.attempts += 1
+            try:
+                result = await call.invoke(*call.args, **call.kwargs)
+            except FloodWait as e:
+                self._on_flood_wait(call, e)
+                continue
+            except Exception as e:
+                if not call.future.done():
+                    call.future.set_exception(e)
+                continue
+            self.global_bucket.recover()
+            if not call.future.done():
+                call.future.set_result(result)
+
+    def _on_flood_wait(self, call, error):
+        seconds = error.value or 1
+        self.flood_waits.append((time.time(), seconds, type(call.args[0]).__name__))
+        logger.warning(f"FloodWait {seconds}s on {type(call.args[0]).__name__} (chat {call.chat})")
+        if seconds > Config.OUTBOUND_MAX_WAIT or call.attempts >= 3:
+            if not call.future.done():
+                call.future.set_exception(error)
+            return
+        now = time.monotonic()
+        if call.chat is None:
+            self.global_bucket.pause(seconds)
+        else:
+            if len(self._chat_paused) > 10000:
+                self._chat_paused = {c: t for c, t in self._chat_paused.items() if t > now}
+            self._chat_paused[call.chat] = now + seconds
+            # Send limits are bot-wide too: slow down everywhere, not just here
+            self.global_bucket.throttle()
+        # Back to the front so the chat's messages keep their order
+        self._enqueue(call, front=True)
+
+
+outbound = OutboundScheduler(
+    Config.OUTBOUND_GLOBAL_RATE,
+    Config.OUTBOUND_CHAT_RATE,
+    Config.OUTBOUND_CHAT_BURST,
+    Config.OUTBOUND_WORKERS
+)
@@ -0,0 +1,132 @@
+import asyncio
+import hashlib
+import json
+import logging
+from helper.caption import render_caption
+from helper.database import DARKXSIDE78
+from helper.transfer import get_media
+
+
+def settings_hash(ctx, new_filename):
+    """Hash of everything that shapes the uploaded file (not its caption).
+
+    The caption is rendered per request and sent alongside the cached
+    file, so users with different caption templates still share uploads.
+    """
+    settings = ctx['settings']
+    effective = {
+        'name': new_filename,
+        'thumb': ctx['thumbnail'],
+        'send_as': settings.get('send_as'),
+        'metadata': ctx['metadata_fields'] if ctx['metadata'] == 'On' else None,
+    }
+    return hashlib.sha1(json.dumps(effective, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def output_key(message, ctx, new_filename):
+    """(source file_unique_id, settings hash), or None if the result can't be reused.
+
+    Sample video and screenshots need the file on disk anyway, so those
+    renames always take the normal path.
+    """
+    settings = ctx['settings']
+    if settings.get('sample_video') or settings.get('screenshot_enabled'):
+        return None
+    media = get_media(message)
+    if not media or not media.file_unique_id:
+        return None
+    return media.file_unique_id, settings_hash(ctx, new_filename)
+
+
+# key -> OutputFlight of the job currently producing that output
+_in_flight = {}
+
+
+class OutputFlight:
+    """The one running job for an output key.
+
+    Identical requests arriving meanwhile wait on `future` instead of
+    starting their own transfer. The job must `finish` with its sent
+    message and, on every path, `release`; a released-but-unfinished
+    flight hands waiters None and the next one takes over.
+    """
+
+    def __init__(self, key):
+        self.key = key
+        self.future = asyncio.get_running_loop().create_future()
+
+    async def finish(self, sent):
+        media = get_media(sent) if sent else None
+        self._resolve(media.file_id if media else None)
+        if media is not None:
+            await DARKXSIDE78.save_cached_output(*self.key, media.file_id)
+
+    def release(self):
+        self._resolve(None)
+
+    def _resolve(self, file_id):
+        if not self.future.done():
+            self.future.set_result(file_id)
+        if _in_flight.get(self.key) is self:
+            del _in_flight[self.key]
+
+
+class _Untracked:
+    """Stand-in flight for renames whose output can't be shared"""
+
+    async def finish(self, sent):
+        pass
+
+    def release(self):
+        pass
+
+
+async def _send_file_id(client, message, new_filename, ctx, key, file_id):
+    caption = await render_caption(ctx['caption'], message, new_filename)
+    try:
+        await client.send_cached_media(chat_id=message.chat.id, file_id=file_id, caption=caption)
+        return True
+    except Exception as e:
+        # A file_id Telegram no longer accepts is dropped and redone normally
+        logging.warning(f"Cached output for {key[0]} unusable, re-uploading: {e}")
+        await DARKXSIDE78.drop_cached_output(*key)
+        return False
+
+
+async def begin_output(client, message, new_filename, ctx):
+    """Serve a rename without transferring anything, or claim it.
+
+    An identical rename already running is waited for and its upload
+    resent; otherwise an earlier identical upload from the cache is.
+    Returns None when the user got the file that way, else the flight
+    the caller must `finish`/`release`.
+    """
+    key = output_key(message, ctx, new_filename)
+    if key is None:
+        return _Untracked()
+    while key in _in_flight:
+        file_id = await asyncio.shield(_in_flight[key].future)
+        if file_id and await _send_file_id(client, message, new_filename, ctx, key, file_id):
+            return None
+
+    # Claimed before the cache lookup so identical requests queue behind us
+    flight = OutputFlight(key)
+    _in_flight[key] = flight
+    try:
+        file_id = await DARKXSIDE78.get_cached_output(*key)
+        if file_id and await _send_file_id(client, message, new_filename, ctx, key, file_id):
+            flight._resolve(file_id)
+            return None
+    except BaseException:
+        flight.release()
+        raise
+    return flight
+
+
+async def remember_output(message, new_filename, ctx, sent):
+    """Record the file_id of `sent`, the upload produced for this rename"""
+    key = output_key(message, ctx, new_filename)
+    media = get_media(sent) if sent else None
+    if key is None or media is None:
+        return
+    await DARKXSIDE78.save_cached_output(*key, media.file_id)
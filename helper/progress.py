@@ -0,0 +1,81 @@
+import asyncio
+import logging
+import time
+from pyrogram.errors import MessageNotModified
+from pyrogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+from config import Config
+from helper.outbound import outbound
+from helper.utils import format_progress
+
+CANCEL_MARKUP = InlineKeyboardMarkup([[InlineKeyboardButton("• ᴄᴀɴᴄᴇʟ •", callback_data="close")]])
+
+
+class ProgressReporter:
+    """Progress callback for one status message.
+
+    Pass `update` as `progress=` to download()/send_*(); pyrogram only
+    awaits plain coroutine functions, so the instance itself won't do.
+    Callbacks only record the latest position; a single pending edit
+    renders it after the minimum interval, stretched by the outbound
+    scheduler's FloodWait backoff (see helper.outbound), and edits whose
+    text didn't change are skipped.
+    """
+
+    def __init__(self, message, action):
+        self.message = message
+        self.action = action
+        self.start = time.time()
+        self._current = 0
+        self._total = 0
+        self._last_edit = 0.0
+        self._last_text = None
+        self._pending = None
+        self._stopped = False
+
+    async def update(self, current, total, *args):
+        self._current, self._total = current, total
+        if self._stopped or (self._pending is not None and not self._pending.done()):
+            return
+        now = time.monotonic()
+        bucket = outbound.global_bucket
+        # While FloodWaits have the scheduler throttled, edit less often too
+        slowdown = bucket.base_rate / bucket.rate
+        delay = max(
+            self._last_edit + Config.PROGRESS_INTERVAL * slowdown - now,
+            bucket.paused_for(),
+            0
+        )
+        self._pending = asyncio.create_task(self._edit_after(delay))
+
+    async def _edit_after(self, delay):
+        await asyncio.sleep(delay)
+        if self._stopped:
+            return
+        text = format_progress(self.action, self._current, self._total, self.start)
+        if text == self._last_text:
+            return
+        try:
+            await self.message.edit_text(text, reply_markup=CANCEL_MARKUP)
+            self._last_text = text
+        except MessageNotModified:
+            self._last_text = text
+        except Exception as e:
+            logging.debug(f"Progress edit failed: {e}")
+        self._last_edit = time.monotonic()
+
+    def restart(self, action):
+        """Reuse the same status message (after `stop`) for the next transfer phase"""
+        self.action = action
+        self.start = time.time()
+        self._current = self._total = 0
+        self._stopped = False
+
+    async def stop(self):
+        """Cancel any pending edit, e.g. before the status message is edited or deleted"""
+        self._stopped = True
+        if self._pending is not None and not self._pending.done():
+            self._pending.cancel()
+            try:
+                await self._pending
+            except (asyncio.CancelledError, Exception):
+                pass
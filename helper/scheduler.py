@@ -0,0 +1,185 @@
+import asyncio
+import logging
+from collections import OrderedDict, defaultdict, deque
+from config import Config
+from helper.metering import reserve_renames
+
+
+class _Job:
+    __slots__ = ('user_id', 'factory', 'premium', 'future', 'started')
+
+    def __init__(self, user_id, factory, premium, future):
+        self.user_id = user_id
+        self.factory = factory
+        self.premium = premium
+        self.future = future
+        self.started = False
+
+
+class JobScheduler:
+    """Bounded job runner with per-user limits and round-robin fairness.
+
+    Jobs wait in one of two lanes (premium and normal). Inside a lane every
+    user has their own FIFO and users take turns, so one user's season pack
+    can't starve everyone else. The premium lane is served first, but after
+    `premium_burst` premium starts in a row a waiting normal job gets a turn.
+    """
+
+    def __init__(self, max_jobs, max_per_user, premium_burst=3):
+        self.max_jobs = max_jobs
+        self.max_per_user = max_per_user
+        self.premium_burst = premium_burst
+        self._lanes = {True: OrderedDict(), False: OrderedDict()}
+        self._running = 0
+        self._running_per_user = defaultdict(int)
+        self._premium_streak = 0
+
+    async def submit(self, user_id, factory, premium=False, on_queued=None):
+        """Run `factory()` when a slot is free and return its result.
+
+        `on_queued(position)` is awaited if the job could not start right away.
+        """
+        job = _Job(user_id, factory, bool(premium), asyncio.get_running_loop().create_future())
+        self._lanes[job.premium].setdefault(user_id, deque()).append(job)
+        self._dispatch()
+
+        if not job.started and on_queued is not None:
+            try:
+                await on_queued(self.position(job))
+            except Exception as e:
+                logging.error(f"Queue notification error: {e}")
+
+        return await job.future
+
+    def position(self, job):
+        """Estimated 1-based queue position of a waiting job"""
+        lane = self._lanes[job.premium]
+        queue = lane.get(job.user_id)
+        if not queue or job not in queue:
+            return 0
+        index = queue.index(job)
+        # Round-robin: every other user in the lane gets up to index + 1 turns first
+        ahead = index + sum(
+            min(len(q), index + 1) for uid, q in lane.items() if uid != job.user_id
+        )
+        if not job.premium:
+            ahead += sum(len(q) for q in self._lanes[True].values())
+        return ahead + 1
+
+    def stats(self):
+        """Running and queued job counts"""
+        return {
+            'running': self._running,
+            'queued_premium': sum(len(q) for q in self._lanes[True].values()),
+            'queued': sum(len(q) for q in self._lanes[False].values())
+        }
+
+    def _dispatch(self):
+        while self._running < self.max_jobs:
+            job = self._next_job()
+            if job is None:
+                return
+            self._start(job)
+
+    def _next_job(self):
+        if self._premium_streak >= self.premium_burst:
+            job = self._pop_from_lane(False)
+            if job is not None:
+                self._premium_streak = 0
+                return job
+
+        job = self._pop_from_lane(True)
+        if job is not None:
+            self._premium_streak += 1
+            return job
+
+        self._premium_streak = 0
+        return self._pop_from_lane(False)
+
+    def _pop_from_lane(self, premium):
+        lane = self._lanes[premium]
+        for user_id in list(lane):
+            queue = lane[user_id]
+            # Drop jobs whose submitter went away while waiting
+            while queue and queue[0].future.done():
+                queue.popleft()
+            if not queue:
+                del lane[user_id]
+                continue
+            if self._running_per_user[user_id] >= self.max_per_user:
+                continue
+            job = queue.popleft()
+            if queue:
+                lane.move_to_end(user_id)
+            else:
+                del lane[user_id]
+            return job
+        return None
+
+    def _start(self, job):
+        job.started = True
+        self._running += 1
+        self._running_per_user[job.user_id] += 1
+        asyncio.ensure_future(self._run(job))
+
+    async def _run(self, job):
+        try:
+            result = await job.factory()
+            if not job.future.done():
+                job.future.set_result(result)
+        except Exception as e:
+            if not job.future.done():
+                job.future.set_exception(e)
+        finally:
+            self._running -= 1
+            self._running_per_user[job.user_id] -= 1
+            if self._running_per_user[job.user_id] <= 0:
+                del self._running_per_user[job.user_id]
+            self._dispatch()
+
+
+rename_scheduler = JobScheduler(Config.MAX_CONCURRENT_JOBS, Config.MAX_JOBS_PER_USER)
+
+# queue_rename's result when no token could be reserved. The user has
+# already been told why, so callers stop without a "failed" message.
+REFUSED = 'refused'
+
+
+async def queue_rename(message, job, premium=False, notify=None):
+    """Charge and run a rename job through the scheduler, telling the user if it has to wait.
+
+    The token is taken before the job is queued and refunded if the job
+    fails. A user without tokens gets told so (by editing `notify` if
+    given) and REFUSED comes back instead of the job's result.
+    """
+    reservation = await reserve_renames(message, notify=notify)
+    if reservation is None:
+        return REFUSED
+    state = {'notice': None, 'started': False}
+
+    async def on_queued(position):
+        notice = await message.reply_text(
+            f"⏳ **Queued**\n\nYour file is **#{position}** in the queue. "
+            "It will start automatically."
+        )
+        if state['started']:
+            await notice.delete()
+        else:
+            state['notice'] = notice
+
+    async def run():
+        state['started'] = True
+        if state['notice'] is not None:
+            try:
+                await state['notice'].delete()
+            except Exception:
+                pass
+        return await job()
+
+    success = False
+    try:
+        success = await rename_scheduler.submit(message.from_user.id, run, premium=premium, on_queued=on_queued)
+        return success
+    finally:
+        if not success:
+            await reservation.refund()
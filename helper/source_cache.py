@@ -0,0 +1,190 @@
+import asyncio
+import logging
+import os
+import shutil
+import tempfile
+from collections import OrderedDict
+from config import Config
+from helper.transfer import download_file, get_media
+
+
+class _Entry:
+    __slots__ = ('path', 'size', 'pins')
+
+    def __init__(self, path, size):
+        self.path = path
+        self.size = size
+        self.pins = 0
+
+
+class SourceCache:
+    """On-disk LRU of downloaded source files, keyed by file_unique_id.
+
+    Jobs never touch an entry directly: `fetch` gives each one a hard
+    link (or, across filesystems, a copy) under DOWNLOAD_LOCATION, so
+    renaming, remuxing or deleting the working file leaves the cache
+    intact. An entry is pinned while it's being downloaded or linked,
+    and eviction skips pinned entries. Downloads (pyrogram's and
+    parallel_download) go into a `.temp` file renamed when complete, so
+    anything left over from a crash is a `.temp` file, removed by `load`.
+
+    Stream renames never touch the disk, so they fill the cache through
+    `tee` instead, and callers skip streaming when `contains` says the
+    file is already here. A budget of 0 turns the cache off.
+    """
+
+    def __init__(self, directory, budget):
+        self.directory = os.path.abspath(directory)
+        self.budget = budget
+        self._entries = OrderedDict()
+        self._loading = {}
+        self.hits = 0
+        self.misses = 0
+
+    def load(self):
+        """Rebuild the index from disk, dropping partial downloads; call at startup"""
+        self._clear_work_files()
+        os.makedirs(self.directory, exist_ok=True)
+        found = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith('.temp'):
+                os.remove(path)
+                continue
+            stat = os.stat(path)
+            found.append((stat.st_mtime, name, path, stat.st_size))
+        self._entries.clear()
+        for _, name, path, size in sorted(found):
+            self._entries[name] = _Entry(path, size)
+        self._evict()
+
+    @staticmethod
+    def _clear_work_files():
+        # Nothing runs yet, so every working copy, metadata remux
+        # (.meta_*) and sample/screenshot dir (.derive_*) is a leftover
+        download_dir = os.path.abspath(Config.DOWNLOAD_LOCATION)
+        if not os.path.isdir(download_dir):
+            return
+        for name in os.listdir(download_dir):
+            path = os.path.join(download_dir, name)
+            try:
+                if os.path.isfile(path) or os.path.islink(path):
+                    os.remove(path)
+                elif name.startswith('.derive_'):
+                    shutil.rmtree(path)
+            except OSError as e:
+                logging.warning(f"Couldn't remove stale work file {path}: {e}")
+
+    def contains(self, message):
+        """True if the message's file is cached, or being downloaded into the cache"""
+        media = get_media(message)
+        key = getattr(media, 'file_unique_id', None)
+        entry = self._entries.get(key)
+        return key in self._loading or (entry is not None and os.path.exists(entry.path))
+
+    async def tee(self, message, chunks):
+        """Pass a stream of `message`'s file through, caching it once it's complete"""
+        media = get_media(message)
+        key = media.file_unique_id
+        if not media.file_size or media.file_size > self.budget or self.contains(message):
+            async for chunk in chunks:
+                yield chunk
+            return
+
+        # A private temp name: a fetch of the same file may write <key>.temp
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.temp')
+        written = 0
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                async for chunk in chunks:
+                    await asyncio.to_thread(f.write, chunk)
+                    written += len(chunk)
+                    yield chunk
+            if written == media.file_size and key not in self._entries:
+                entry = _Entry(os.path.join(self.directory, key), written)
+                os.replace(temp_path, entry.path)
+                self._entries[key] = entry
+                self._evict()
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    async def fetch(self, message, progress=None):
+        """Local working copy of a message's file, downloading it only on a miss"""
+        media = get_media(message)
+        key = media.file_unique_id
+        work_path = os.path.join(
+            os.path.abspath(Config.DOWNLOAD_LOCATION),
+            f"{message.chat.id}_{message.id}_{getattr(media, 'file_name', None) or key}"
+        )
+        if not media.file_size or media.file_size > self.budget:
+            return await download_file(message, work_path, progress)
+
+        # An identical download already running is shared, not repeated
+        while key in self._loading:
+            await asyncio.shield(self._loading[key])
+
+        entry = self._entries.get(key)
+        if entry is not None and os.path.exists(entry.path):
+            self.hits += 1
+            self._entries.move_to_end(key)
+            # mtime carries the LRU order across restarts
+            os.utime(entry.path)
+            entry.pins += 1
+            try:
+                return await self._link(entry, work_path)
+            finally:
+                entry.pins -= 1
+
+        self.misses += 1
+        loading = asyncio.get_running_loop().create_future()
+        self._loading[key] = loading
+        entry = _Entry(os.path.join(self.directory, key), media.file_size)
+        entry.pins += 1
+        try:
+            if not await download_file(message, entry.path, progress):
+                return None
+            self._entries[key] = entry
+            return await self._link(entry, work_path)
+        finally:
+            entry.pins -= 1
+            del self._loading[key]
+            loading.set_result(None)
+            self._evict()
+
+    async def _link(self, entry, work_path):
+        os.makedirs(os.path.dirname(work_path), exist_ok=True)
+        if os.path.exists(work_path):
+            os.remove(work_path)
+        try:
+            os.link(entry.path, work_path)
+        except OSError:
+            # Cross-device: a full copy, kept off the event loop
+            await asyncio.to_thread(shutil.copyfile, entry.path, work_path)
+        return work_path
+
+    def _evict(self):
+        total = sum(entry.size for entry in self._entries.values())
+        for key in list(self._entries):
+            if total <= self.budget:
+                break
+            entry = self._entries[key]
+            if entry.pins:
+                continue
+            del self._entries[key]
+            total -= entry.size
+            try:
+                os.remove(entry.path)
+            except OSError as e:
+                logging.warning(f"Couldn't evict cached source {key}: {e}")
+
+    def stats(self):
+        return {
+            'entries': len(self._entries),
+            'bytes': sum(entry.size for entry in self._entries.values()),
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+
+source_cache = SourceCache(Config.SOURCE_CACHE_DIR, Config.SOURCE_CACHE_SIZE)
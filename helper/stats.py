@@ -0,0 +1,53 @@
+import asyncio
+import logging
+from config import Config
+from helper.database import DARKXSIDE78
+
+
+class StatsCache:
+    """In-memory copy of the materialized leaderboard/totals document.
+
+    /leaderboard and /stats read `snapshot()` only; the document is
+    rebuilt (one indexed top-N query plus one aggregate) every
+    STATS_REFRESH_INTERVAL seconds, so command bursts never reach Mongo.
+    The saved copy is loaded at startup so the first reads after a
+    restart don't wait for a rebuild.
+    """
+
+    def __init__(self, interval, top_n):
+        self.interval = interval
+        self.top_n = top_n
+        self._stats = None
+        self._task = None
+        self._refreshing = None
+
+    def snapshot(self):
+        return self._stats
+
+    async def get(self):
+        """The cached stats, building them once if nothing is loaded yet"""
+        if self._stats is None:
+            await self.refresh()
+        return self._stats
+
+    async def refresh(self):
+        # Concurrent callers share one rebuild
+        if self._refreshing is None or self._refreshing.done():
+            self._refreshing = asyncio.create_task(DARKXSIDE78.build_stats(self.top_n))
+        try:
+            self._stats = await asyncio.shield(self._refreshing)
+        except Exception as e:
+            logging.error(f"Stats refresh failed: {e}")
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        self._stats = await DARKXSIDE78.get_saved_stats()
+        while True:
+            await self.refresh()
+            await asyncio.sleep(self.interval)
+
+
+stats_cache = StatsCache(Config.STATS_REFRESH_INTERVAL, Config.LEADERBOARD_SIZE)
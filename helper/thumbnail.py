@@ -0,0 +1,130 @@
+import asyncio
+import hashlib
+import io
+import logging
+import os
+import tempfile
+from collections import OrderedDict
+from PIL import Image
+from config import Config
+from helper.ffmpeg import probe_duration, extract_frame
+
+# Telegram's limits for document/video thumbnails
+THUMB_MAX_SIDE = 320
+THUMB_MAX_BYTES = 200 * 1024
+
+# file_id -> cached JPEG path, so repeat uploads skip download and Pillow
+_by_file_id = OrderedDict()
+_FILE_ID_INDEX_SIZE = 1024
+
+
+def compress_thumbnail(data):
+    """Down-scale and JPEG-compress image bytes to Telegram's thumbnail limits"""
+    with Image.open(io.BytesIO(data)) as image:
+        image = image.convert("RGB")
+        image.thumbnail((THUMB_MAX_SIDE, THUMB_MAX_SIDE), Image.LANCZOS)
+        for quality in (90, 80, 70, 60, 50, 40):
+            output = io.BytesIO()
+            image.save(output, "JPEG", quality=quality, optimize=True)
+            if output.tell() <= THUMB_MAX_BYTES:
+                break
+        return output.getvalue()
+
+
+def _store(data):
+    """Compress image bytes into the content-addressed cache, return the path"""
+    os.makedirs(Config.THUMB_CACHE_DIR, exist_ok=True)
+    digest = hashlib.sha256(data).hexdigest()[:32]
+    path = os.path.join(Config.THUMB_CACHE_DIR, f"{digest}.jpg")
+    if os.path.exists(path):
+        os.utime(path)
+        return path
+
+    processed = compress_thumbnail(data)
+    # Write then rename so a concurrent reader never sees a partial JPEG
+    fd, temp_path = tempfile.mkstemp(dir=Config.THUMB_CACHE_DIR, suffix=".part")
+    with os.fdopen(fd, "wb") as f:
+        f.write(processed)
+    os.replace(temp_path, path)
+    _evict()
+    return path
+
+
+def _evict():
+    """Drop least recently used thumbnails until the cache fits its budget"""
+    entries = []
+    total = 0
+    for entry in os.scandir(Config.THUMB_CACHE_DIR):
+        if entry.name.endswith(".jpg"):
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+    for _, size, path in sorted(entries):
+        if total <= Config.THUMB_CACHE_SIZE:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
+
+
+def _remember(file_id, path):
+    _by_file_id[file_id] = path
+    _by_file_id.move_to_end(file_id)
+    while len(_by_file_id) > _FILE_ID_INDEX_SIZE:
+        _by_file_id.popitem(last=False)
+
+
+async def get_cached_thumbnail(client, file_id):
+    """Local, Telegram-ready JPEG for a photo/thumbnail file_id"""
+    path = _by_file_id.get(file_id)
+    if path and os.path.exists(path):
+        _by_file_id.move_to_end(file_id)
+        os.utime(path)
+        return path
+
+    image = await client.download_media(file_id, in_memory=True)
+    path = await asyncio.to_thread(_store, image.getvalue())
+    _remember(file_id, path)
+    return path
+
+
+async def generate_video_thumbnail(file_path, duration=0):
+    """Thumbnail from a frame about 10% into a local video"""
+    duration = duration or await probe_duration(file_path)
+    fd, frame_path = tempfile.mkstemp(suffix=".jpg")
+    os.close(fd)
+    try:
+        if not await extract_frame(file_path, frame_path, duration * 0.1 if duration else 1):
+            return None
+        with open(frame_path, "rb") as f:
+            data = f.read()
+        return await asyncio.to_thread(_store, data)
+    finally:
+        os.remove(frame_path)
+
+
+async def resolve_thumbnail(client, message, thumb_file_id=None, file_path=None):
+    """Pick the thumbnail for an upload as a local JPEG path, or None.
+
+    In order: the user's custom thumbnail, a frame of the local video
+    (when `file_path` is given), then the source file's own Telegram
+    thumbnail. Failures never block the upload.
+    """
+    try:
+        if thumb_file_id:
+            return await get_cached_thumbnail(client, thumb_file_id)
+
+        media = message.document or message.video or message.audio
+        if file_path and (message.video or (media and (media.mime_type or "").startswith("video/"))):
+            duration = message.video.duration if message.video else 0
+            path = await generate_video_thumbnail(file_path, duration)
+            if path:
+                return path
+
+        if media and media.thumbs:
+            return await get_cached_thumbnail(client, media.thumbs[-1].file_id)
+    except Exception as e:
+        logging.error(f"Thumbnail error: {e}")
+    return None
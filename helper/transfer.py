@@ -0,0 +1,492 @@
+import asyncio
+import logging
+import math
+import os
+import tempfile
+from collections import defaultdict, deque
+from hashlib import md5
+from pyrogram import raw, types, utils
+from pyrogram.errors import Unauthorized
+from pyrogram.file_id import FileId
+from pyrogram.session import Auth, Session
+from config import Config
+from helper.ffmpeg import VIDEO_EXTENSIONS
+
+# MTProto upload part size; download chunks (1 MiB) split evenly into these
+PART_SIZE = 512 * 1024
+BIG_FILE_SIZE = 10 * 1024 * 1024
+# upload.GetFile request size for parallel downloads (its maximum)
+DOWNLOAD_CHUNK = 1024 * 1024
+# Seconds between throughput samples that decide the download worker count
+DOWNLOAD_PROBE_INTERVAL = 3
+
+
+def get_media(message):
+    """Return the document/video/audio object carried by a message"""
+    return message.document or message.video or message.audio
+
+
+def can_stream_rename(message, ctx, new_filename):
+    """True if a rename needs no content change and can skip the local copy.
+
+    Metadata, sample video and screenshots all need the file on disk, and a
+    document sent as video needs ffprobe'd dimensions, so those take the
+    regular download path.
+    """
+    settings = ctx['settings']
+    if ctx['metadata'] != 'Off':
+        return False
+    if settings.get('sample_video') or settings.get('screenshot_enabled'):
+        return False
+    if message.document and settings.get('send_as') == 'media' and new_filename.lower().endswith(VIDEO_EXTENSIONS):
+        return False
+    media = get_media(message)
+    return bool(media and media.file_size)
+
+
+# Like pyrogram's client.media_sessions, but several per DC: a foreign DC
+# gets one auth key, created and authorized once, shared by all its
+# sessions, and finished transfers hand their sessions back for reuse
+_dc_auth_keys = {}  # dc_id -> auth key authorized there
+_dc_locks = defaultdict(asyncio.Lock)
+_idle_sessions = defaultdict(list)  # dc_id -> started, unused sessions
+
+
+async def _dc_auth_key(client, dc_id, test_mode):
+    if dc_id == await client.storage.dc_id():
+        return await client.storage.auth_key()
+    async with _dc_locks[dc_id]:
+        if dc_id not in _dc_auth_keys:
+            auth_key = await Auth(client, dc_id, test_mode).create()
+            session = Session(client, dc_id, auth_key, test_mode, is_media=True)
+            await session.start()
+            try:
+                exported = await client.invoke(raw.functions.auth.ExportAuthorization(dc_id=dc_id))
+                await session.invoke(raw.functions.auth.ImportAuthorization(id=exported.id, bytes=exported.bytes))
+            except BaseException:
+                await session.stop()
+                raise
+            _dc_auth_keys[dc_id] = auth_key
+            _idle_sessions[dc_id].append(session)
+        return _dc_auth_keys[dc_id]
+
+
+async def _open_dc_session(client, dc_id):
+    """Media session to `dc_id`, from the idle pool or newly started; hand it back with `_release_session`"""
+    test_mode = await client.storage.test_mode()
+    auth_key = await _dc_auth_key(client, dc_id, test_mode)
+    if _idle_sessions[dc_id]:
+        return _idle_sessions[dc_id].pop()
+    session = Session(client, dc_id, auth_key, test_mode, is_media=True)
+    await session.start()
+    return session
+
+
+async def _release_session(dc_id, session, error=None):
+    """Pool a session after use, or stop it if its transfer failed or the pool is full"""
+    if error is None and len(_idle_sessions[dc_id]) < Config.PARALLEL_DOWNLOAD_MAX_WORKERS:
+        _idle_sessions[dc_id].append(session)
+        return
+    if isinstance(error, Unauthorized):
+        # The DC dropped our authorization; the next session redoes it
+        _dc_auth_keys.pop(dc_id, None)
+        for idle in _idle_sessions.pop(dc_id, []):
+            await _stop_session(idle)
+    await _stop_session(session)
+
+
+async def _stop_session(session):
+    try:
+        await session.stop()
+    except Exception:
+        pass
+
+
+class StreamBuffer:
+    """Bounded FIFO of byte chunks between a download and an upload.
+
+    Up to `memory_limit` bytes are held in memory. When that's full the
+    producer either waits (the default, nothing touches disk) or, with
+    `spill_dir`, appends the overflow to a temp file which is read back in
+    order once the in-memory chunks are drained.
+    """
+
+    def __init__(self, memory_limit, spill_dir=None):
+        self.memory_limit = memory_limit
+        self.spill_dir = spill_dir
+        self._chunks = deque()
+        self._memory = 0
+        self._spill = None
+        self._spill_offset = 0
+        self._spill_read = 0
+        self._spill_write = 0
+        self._closed = False
+        self._changed = asyncio.Condition()
+
+    async def put(self, chunk):
+        async with self._changed:
+            if self._spill is None or self._spill_read == self._spill_write:
+                while self._memory + len(chunk) > self.memory_limit and self._chunks and self.spill_dir is None:
+                    await self._changed.wait()
+                if self._memory + len(chunk) <= self.memory_limit or not self._chunks:
+                    self._chunks.append(chunk)
+                    self._memory += len(chunk)
+                    self._changed.notify_all()
+                    return
+            await self._spill_chunk(chunk)
+            self._changed.notify_all()
+
+    async def _spill_chunk(self, chunk):
+        if self._spill is None:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            self._spill = tempfile.TemporaryFile(dir=self.spill_dir)
+        self._spill.seek(0, os.SEEK_END)
+        await asyncio.to_thread(self._spill.write, len(chunk).to_bytes(4, 'big') + chunk)
+        self._spill_write += 1
+
+    async def _read_spilled(self):
+        def read():
+            size = int.from_bytes(self._spill.read(4), 'big')
+            return self._spill.read(size)
+        self._spill.seek(self._spill_offset)
+        chunk = await asyncio.to_thread(read)
+        self._spill_offset = self._spill.tell()
+        self._spill_read += 1
+        return chunk
+
+    async def get(self):
+        """Next chunk, or None once the producer closed and everything was read"""
+        async with self._changed:
+            while True:
+                if self._chunks:
+                    chunk = self._chunks.popleft()
+                    self._memory -= len(chunk)
+                    self._changed.notify_all()
+                    return chunk
+                if self._spill is not None and self._spill_read < self._spill_write:
+                    return await self._read_spilled()
+                if self._closed:
+                    return None
+                await self._changed.wait()
+
+    async def close(self):
+        async with self._changed:
+            self._closed = True
+            self._changed.notify_all()
+
+    def discard(self):
+        self._chunks.clear()
+        if self._spill is not None:
+            self._spill.close()
+            self._spill = None
+
+
+async def upload_stream(client, chunks, file_size, file_name, progress=None):
+    """Upload an async iterator of byte chunks as a Telegram InputFile.
+
+    The download runs in its own task and feeds a StreamBuffer, while
+    `STREAM_UPLOAD_WORKERS` parts are uploaded in parallel, so both
+    directions overlap and memory stays bounded by STREAM_BUFFER_SIZE.
+    `progress(current, total)` is awaited after every uploaded part.
+    """
+    is_big = file_size > BIG_FILE_SIZE
+    total_parts = math.ceil(file_size / PART_SIZE)
+    file_id = client.rnd_id()
+    md5_sum = None if is_big else md5()
+    buffer = StreamBuffer(
+        Config.STREAM_BUFFER_SIZE,
+        spill_dir=Config.DOWNLOAD_LOCATION if Config.STREAM_SPILL_TO_DISK else None
+    )
+    parts = asyncio.Queue(Config.STREAM_UPLOAD_WORKERS)
+    dc_id = await client.storage.dc_id()
+    session = await _open_dc_session(client, dc_id)
+    uploaded = 0
+
+    async def download():
+        try:
+            async for chunk in chunks:
+                await buffer.put(chunk)
+        finally:
+            await buffer.close()
+            # An aborted upload closes the source now rather than at GC, so
+            # wrappers such as source_cache.tee clean up their temp file
+            aclose = getattr(chunks, 'aclose', None)
+            if aclose is not None:
+                await aclose()
+
+    async def worker():
+        nonlocal uploaded
+        while True:
+            item = await parts.get()
+            if item is None:
+                return
+            part_no, data = item
+            if is_big:
+                rpc = raw.functions.upload.SaveBigFilePart(
+                    file_id=file_id, file_part=part_no, file_total_parts=total_parts, bytes=data
+                )
+            else:
+                rpc = raw.functions.upload.SaveFilePart(file_id=file_id, file_part=part_no, bytes=data)
+            await session.invoke(rpc)
+            uploaded += len(data)
+            if progress is not None:
+                await progress(uploaded, file_size)
+
+    async def feed():
+        part_no = 0
+        pending = bytearray()
+        while True:
+            chunk = await buffer.get()
+            if chunk is None:
+                break
+            pending += chunk
+            while len(pending) >= PART_SIZE:
+                data = bytes(pending[:PART_SIZE])
+                del pending[:PART_SIZE]
+                if md5_sum is not None:
+                    md5_sum.update(data)
+                await parts.put((part_no, data))
+                part_no += 1
+        if pending:
+            if md5_sum is not None:
+                md5_sum.update(pending)
+            await parts.put((part_no, bytes(pending)))
+            part_no += 1
+        for _ in workers:
+            await parts.put(None)
+        return part_no
+
+    downloader = asyncio.create_task(download())
+    workers = [asyncio.create_task(worker()) for _ in range(Config.STREAM_UPLOAD_WORKERS)]
+    feeder = asyncio.create_task(feed())
+    error = None
+    try:
+        # Any failing task (download, a part upload or the feeder) aborts the rest
+        done, _ = await asyncio.wait([downloader, feeder, *workers], return_when=asyncio.FIRST_EXCEPTION)
+        for task in done:
+            if task.exception() is not None:
+                raise task.exception()
+        sent_parts = feeder.result()
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        for task in [downloader, feeder, *workers]:
+            task.cancel()
+        buffer.discard()
+        await _release_session(dc_id, session, error)
+
+    if sent_parts != total_parts:
+        raise IOError(f"Streamed {sent_parts} parts, expected {total_parts}")
+
+    if is_big:
+        return raw.types.InputFileBig(id=file_id, parts=total_parts, name=file_name)
+    return raw.types.InputFile(id=file_id, parts=total_parts, name=file_name, md5_checksum=md5_sum.hexdigest())
+
+
+async def upload_thumbnail(client, thumb):
+    """Upload a thumbnail given as a local path (see helper.thumbnail) or a file_id"""
+    if not thumb:
+        return None
+    if not os.path.isfile(thumb):
+        thumb = await client.download_media(thumb, in_memory=True)
+    return await client.save_file(thumb)
+
+
+def _media_attributes(message, file_name):
+    attributes = [raw.types.DocumentAttributeFilename(file_name=file_name)]
+    if message.video:
+        attributes.append(raw.types.DocumentAttributeVideo(
+            duration=message.video.duration or 0,
+            w=message.video.width or 0,
+            h=message.video.height or 0,
+            supports_streaming=True
+        ))
+    elif message.audio:
+        attributes.append(raw.types.DocumentAttributeAudio(
+            duration=message.audio.duration or 0,
+            title=message.audio.title,
+            performer=message.audio.performer
+        ))
+    return attributes
+
+
+async def send_uploaded_media(client, message, chat_id, file, file_name, caption, thumb=None):
+    """Send an already uploaded InputFile with the attributes of the source media"""
+    media = get_media(message)
+    input_media = raw.types.InputMediaUploadedDocument(
+        mime_type=media.mime_type or client.guess_mime_type(file_name) or "application/octet-stream",
+        file=file,
+        force_file=True if message.document else None,
+        thumb=await upload_thumbnail(client, thumb),
+        attributes=_media_attributes(message, file_name)
+    )
+    r = await client.invoke(
+        raw.functions.messages.SendMedia(
+            peer=await client.resolve_peer(chat_id),
+            media=input_media,
+            random_id=client.rnd_id(),
+            **await utils.parse_text_entities(client, caption, None, None)
+        )
+    )
+    for update in r.updates:
+        if isinstance(update, (raw.types.UpdateNewMessage, raw.types.UpdateNewChannelMessage)):
+            return await types.Message._parse(
+                client, update.message,
+                {u.id: u for u in r.users},
+                {c.id: c for c in r.chats}
+            )
+    return None
+
+
+async def stream_rename(client, message, new_filename, caption, thumb=None, progress=None, chunks=None):
+    """Re-send a file under a new name without downloading it to disk.
+
+    Telegram can't rename an existing document, so the bytes still go down
+    and back up, but chunk by chunk straight from the download into the
+    upload. `chunks` replaces the plain `client.stream_media` download,
+    e.g. to tee it into the source cache. Returns the sent message, or
+    None if anything failed so the caller can fall back to the regular path.
+    """
+    media = get_media(message)
+    if chunks is None:
+        chunks = client.stream_media(message)
+    try:
+        file = await upload_stream(client, chunks, media.file_size, new_filename, progress)
+        return await send_uploaded_media(
+            client, message, message.chat.id, file, new_filename, caption, thumb
+        )
+    except Exception as e:
+        logging.error(f"Stream rename failed, falling back to download: {e}")
+        return None
+
+
+async def parallel_download(client, message, file_path, progress=None):
+    """Download a message's file over several media sessions at once.
+
+    The file is cut into DOWNLOAD_CHUNK ranges taken from a shared queue.
+    Each worker takes a session from the DC's pool and `pwrite`s its
+    ranges straight into a file preallocated to the full size, so nothing
+    is reassembled. The
+    worker count starts at PARALLEL_DOWNLOAD_MIN_WORKERS and grows by one
+    each probe interval while the last addition raised throughput by at
+    least 10%, up to PARALLEL_DOWNLOAD_MAX_WORKERS; if throughput later
+    drops well below the best seen, a worker is retired. Bytes go to
+    `<file_path>.temp`, renamed once every range is in.
+    """
+    media = get_media(message)
+    file_id = FileId.decode(media.file_id)
+    location = raw.types.InputDocumentFileLocation(
+        id=file_id.media_id,
+        access_hash=file_id.access_hash,
+        file_reference=file_id.file_reference,
+        thumb_size=file_id.thumbnail_size
+    )
+    size = media.file_size
+    ranges = deque(range(math.ceil(size / DOWNLOAD_CHUNK)))
+    temp_path = f"{file_path}.temp"
+    os.makedirs(os.path.dirname(temp_path) or '.', exist_ok=True)
+    fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    state = {'done': 0, 'active': 0, 'target': max(1, Config.PARALLEL_DOWNLOAD_MIN_WORKERS)}
+    tasks = []
+    # Thread writes outlive a cancelled worker; fd is only closed once they're done
+    writes = set()
+
+    async def worker():
+        state['active'] += 1
+        session = await _open_dc_session(client, file_id.dc_id)
+        try:
+            while ranges:
+                if state['active'] > state['target']:
+                    break
+                index = ranges.popleft()
+                offset = index * DOWNLOAD_CHUNK
+                r = await session.invoke(
+                    raw.functions.upload.GetFile(location=location, offset=offset, limit=DOWNLOAD_CHUNK),
+                    sleep_threshold=30
+                )
+                if not isinstance(r, raw.types.upload.File):
+                    raise IOError("File is served from a CDN; parallel download not supported")
+                if len(r.bytes) != min(DOWNLOAD_CHUNK, size - offset):
+                    raise IOError(f"Short read at offset {offset}: {len(r.bytes)} bytes")
+                write = asyncio.ensure_future(asyncio.to_thread(os.pwrite, fd, r.bytes, offset))
+                writes.add(write)
+                write.add_done_callback(writes.discard)
+                await asyncio.shield(write)
+                state['done'] += len(r.bytes)
+                if progress is not None:
+                    await progress(state['done'], size)
+        except BaseException as e:
+            await _release_session(file_id.dc_id, session, e)
+            raise
+        await _release_session(file_id.dc_id, session)
+        state['active'] -= 1
+
+    completed = False
+    try:
+        # Reserve the whole file up front so positional writes never extend it
+        if hasattr(os, 'posix_fallocate'):
+            os.posix_fallocate(fd, 0, size)
+        else:
+            os.ftruncate(fd, size)
+
+        tasks = [asyncio.create_task(worker()) for _ in range(state['target'])]
+        growing = True
+        last_rate = best_rate = 0
+        last_done = 0
+        while True:
+            done, pending = await asyncio.wait(
+                tasks, timeout=DOWNLOAD_PROBE_INTERVAL, return_when=asyncio.FIRST_EXCEPTION
+            )
+            for task in done:
+                if task.exception() is not None:
+                    raise task.exception()
+            if not pending:
+                if ranges:
+                    # Every worker retired with work left; keep one going
+                    tasks.append(asyncio.create_task(worker()))
+                    continue
+                break
+
+            rate = (state['done'] - last_done) / DOWNLOAD_PROBE_INTERVAL
+            last_done = state['done']
+            best_rate = max(best_rate, rate)
+            if growing and ranges and state['target'] < Config.PARALLEL_DOWNLOAD_MAX_WORKERS:
+                if rate >= last_rate * 1.1:
+                    state['target'] += 1
+                    tasks.append(asyncio.create_task(worker()))
+                else:
+                    growing = False
+                last_rate = rate
+            elif not growing and rate < best_rate * 0.6 and state['target'] > 1:
+                state['target'] -= 1
+
+        if state['done'] != size:
+            raise IOError(f"Downloaded {state['done']} of {size} bytes")
+        completed = True
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, *writes, return_exceptions=True)
+        os.close(fd)
+        if completed:
+            os.replace(temp_path, file_path)
+        elif os.path.exists(temp_path):
+            os.remove(temp_path)
+    return file_path
+
+
+async def download_file(message, file_path, progress=None):
+    """Download a message's file to `file_path`, in parallel when it's large.
+
+    Only the download path (source cache misses, metadata, sample and
+    screenshots) comes through here; stream renames read the file with
+    client.stream_media.
+    """
+    media = get_media(message)
+    if media.file_size and media.file_size >= Config.PARALLEL_DOWNLOAD_MIN_SIZE:
+        try:
+            return await parallel_download(message._client, message, file_path, progress)
+        except Exception as e:
+            logging.error(f"Parallel download failed, retrying as a single stream: {e}")
+    return await message.download(file_name=file_path, progress=progress)
@@ -7,33 +7,40 @@ from pyrogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 import re
 
 
+def format_progress(ud_type, current, total, start):
+    """Progress bar text for a transfer that started at `start` (time.time())"""
+    diff = max(time.time() - start, 0.001)
+    percentage = current * 100 / total if total else 0
+    speed = current / diff
+    elapsed_time = round(diff) * 1000
+    time_to_completion = round((total - current) / speed) * 1000 if speed else 0
+    estimated_total_time = elapsed_time + time_to_completion
+
+    elapsed_time = TimeFormatter(milliseconds=elapsed_time)
+    estimated_total_time = TimeFormatter(milliseconds=estimated_total_time)
+
+    progress = "{0}{1}".format(
+        ''.join(["■" for i in range(math.floor(percentage / 5))]),
+        ''.join(["□" for i in range(20 - math.floor(percentage / 5))])
+    )            
+    tmp = progress + Txt.PROGRESS_BAR.format( 
+        round(percentage, 2),
+        humanbytes(current),
+        humanbytes(total),
+        humanbytes(speed),            
+        estimated_total_time if estimated_total_time != '' else "0 s"
+    )
+    return f"{ud_type}\n\n{tmp}"
+
 async def progress_for_pyrogram(current, total, ud_type, message, start):
+    """Stateless progress callback; prefer helper.progress.ProgressReporter,
+    which coalesces updates and backs off on FloodWait."""
     now = time.time()
     diff = now - start
     if round(diff % 5.00) == 0 or current == total:        
-        percentage = current * 100 / total
-        speed = current / diff
-        elapsed_time = round(diff) * 1000
-        time_to_completion = round((total - current) / speed) * 1000
-        estimated_total_time = elapsed_time + time_to_completion
-
-        elapsed_time = TimeFormatter(milliseconds=elapsed_time)
-        estimated_total_time = TimeFormatter(milliseconds=estimated_total_time)
-
-        progress = "{0}{1}".format(
-            ''.join(["■" for i in range(math.floor(percentage / 5))]),
-            ''.join(["□" for i in range(20 - math.floor(percentage / 5))])
-        )            
-        tmp = progress + Txt.PROGRESS_BAR.format( 
-            round(percentage, 2),
-            humanbytes(current),
-            humanbytes(total),
-            humanbytes(speed),            
-            estimated_total_time if estimated_total_time != '' else "0 s"
-        )
         try:
             await message.edit(
-                text=f"{ud_type}\n\n{tmp}",               
+                text=format_progress(ud_type, current, total, start),
                 reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("• ᴄᴀɴᴄᴇʟ •", callback_data="close")]])                                               
             )
         except:
@@ -1,12 +1,15 @@
 from config import Config, Txt
 from helper.database import DARKXSIDE78
+from helper.broadcast import cancel_broadcast, is_running, resume_broadcast, start_broadcast
+from helper.outbound import outbound
+from helper.source_cache import source_cache
+from helper.stats import stats_cache
+from helper.utils import humanbytes
 from pyrogram.types import Message
 from pyrogram import Client, filters
-from pyrogram.errors import FloodWait, InputUserDeactivated, UserIsBlocked, PeerIdInvalid
-import os, sys, time, asyncio, logging, datetime
+import os, sys, time, logging
 from pyrogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 from datetime import datetime, timedelta
-import pytz  # If using timezones
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -33,8 +36,9 @@ async def restart_bot(b, m):
 #@Client.on_message(filters.command("leaderboard") & filters.user(Config.ADMIN))
 async def show_leaderboard(bot: Client, message: Message):
     try:
-        users = await DARKXSIDE78.col.find().sort("rename_count", -1).limit(10).to_list(10)
-        leaderboard = ["<b>🏆 Top 10 Renamers 🏆</b>\n"]
+        stats = await stats_cache.get()
+        users = stats['leaderboard'] if stats else []
+        leaderboard = [f"<b>🏆 Top {stats_cache.top_n} Renamers 🏆</b>\n"]
         
         for idx, user in enumerate(users, 1):
             name = user.get('first_name', 'Unknown').strip() or "Anonymous"
@@ -70,6 +74,7 @@ async def add_tokens(bot: Client, message: Message):
             {"_id": user['_id']},
             {"$set": {"token": new_tokens}}
         )
+        DARKXSIDE78.invalidate_user(user['_id'])
         await message.reply_text(f"✅ Added {amount} tokens to user {user['_id']}. New balance: {new_tokens}")
     except Exception as e:
         await message.reply_text(f"Error: {e}\nUsage: /add_token <amount> @username/userid")
@@ -93,6 +98,7 @@ async def remove_tokens(bot: Client, message: Message):
             {"_id": user['_id']},
             {"$set": {"token": new_tokens}}
         )
+        DARKXSIDE78.invalidate_user(user['_id'])
         await message.reply_text(f"✅ Removed {amount} tokens from user {user['_id']}. New balance: {new_tokens}")
     except Exception as e:
         await message.reply_text(f"Error: {e}\nUsage: /remove_token <amount> @username/userid")
@@ -133,6 +139,7 @@ async def add_premium(bot: Client, message: Message):
                 "premium_expiry": expiry
             }}
         )
+        DARKXSIDE78.invalidate_user(user['_id'])
         await message.reply_text(f"✅ Premium added until {expiry}")
     except Exception as e:
         await message.reply_text(f"Error: {e}\nUsage: /add_premium @username/userid 1d (1h/1m/1y/lifetime)")
@@ -157,6 +164,7 @@ async def remove_premium(bot: Client, message: Message):
                 "premium_expiry": None
             }}
         )
+        DARKXSIDE78.invalidate_user(user['_id'])
         await message.reply_text("✅ Premium access removed")
     except Exception as e:
         await message.reply_text(f"Error: {e}\nUsage: /remove_premium @username/userid")
@@ -178,55 +186,37 @@ async def tutorial(bot: Client, message: Message):
 
 @Client.on_message(filters.command(["stats", "status"]) & filters.user(Config.ADMIN))
 async def get_stats(bot, message):
-    total_users = await DARKXSIDE78.total_users_count()
+    stats = await stats_cache.get() or {}
+    total_users = stats.get('total_users', 0)
     uptime = time.strftime("%Hh%Mm%Ss", time.gmtime(time.time() - bot.uptime))    
     start_t = time.time()
     st = await message.reply('**Accessing The Details.....**')    
     end_t = time.time()
     time_taken_s = (end_t - start_t) * 1000
-    await st.edit(text=f"**--Bot Status--** \n\n**⌚️ Bot Uptime :** {uptime} \n**🐌 Current Ping :** `{time_taken_s:.3f} ms` \n**👭 Total Users :** `{total_users}`")
+    cache = DARKXSIDE78.cache_stats()
+    api = outbound.stats()
+    sources = source_cache.stats()
+    await st.edit(text=f"**--Bot Status--** \n\n**⌚️ Bot Uptime :** {uptime} \n**🐌 Current Ping :** `{time_taken_s:.3f} ms` \n**👭 Total Users :** `{total_users}`\n**✏️ Total Renames :** `{stats.get('total_renames', 0)} ({humanbytes(stats.get('total_bytes', 0)) or '0 ʙ'})`\n**🗃 User Cache :** `{cache['hits']} hits / {cache['misses']} misses ({cache['hit_rate']:.1f}%)`\n**💾 Source Cache :** `{sources['entries']} files, {humanbytes(sources['bytes']) or '0 ʙ'} ({sources['hits']} hits / {sources['misses']} misses)`\n**📮 API Queue :** `{api['queued']} queued ({api['queued_broadcast']} broadcast), {api['merged_edits']} edits merged`\n**🌊 FloodWaits (1h) :** `{api['flood_waits_1h']} ({api['flood_wait_seconds_1h']}s)`")
 
-@Client.on_message(filters.command("broadcast") & filters.user(Config.ADMIN) & filters.reply)
+@Client.on_message(filters.command("broadcast") & filters.user(Config.ADMIN))
 async def broadcast_handler(bot: Client, m: Message):
+    action = m.command[1].lower() if len(m.command) > 1 else None
+    if action == "cancel":
+        await cancel_broadcast()
+        return await m.reply_text("Broadcast cancelled.")
+    if action == "resume":
+        if not await resume_broadcast(bot, reason="by admin"):
+            await m.reply_text("Nothing to resume." if not is_running() else "A broadcast is already running.")
+        return
+    if not m.reply_to_message:
+        return await m.reply_text("Reply to the message to broadcast, or use `/broadcast resume` / `/broadcast cancel`.")
+    if is_running():
+        return await m.reply_text("A broadcast is already running. Stop it with `/broadcast cancel`.")
+    if await DARKXSIDE78.get_broadcast_state():
+        return await m.reply_text(
+            "An unfinished broadcast is saved. Continue it with `/broadcast resume` "
+            "or drop it with `/broadcast cancel`."
+        )
     await bot.send_message(Config.LOG_CHANNEL, f"{m.from_user.mention} or {m.from_user.id} Is Started The Broadcast......")
-    all_users = await DARKXSIDE78.get_all_users()
-    broadcast_msg = m.reply_to_message
     sts_msg = await m.reply_text("Broadcast Started..!") 
-    done = 0
-    failed = 0
-    success = 0
-    start_time = time.time()
-    total_users = await DARKXSIDE78.total_users_count()
-    async for user in all_users:
-        sts = await send_msg(user['_id'], broadcast_msg)
-        if sts == 200:
-           success += 1
-        else:
-           failed += 1
-        if sts == 400:
-           await DARKXSIDE78.delete_user(user['_id'])
-        done += 1
-        if not done % 20:
-           await sts_msg.edit(f"Broadcast In Progress: \n\nTotal Users {total_users} \nCompleted : {done} / {total_users}\nSuccess : {success}\nFailed : {failed}")
-    completed_in = datetime.timedelta(seconds=int(time.time() - start_time))
-    await sts_msg.edit(f"Bʀᴏᴀᴅᴄᴀꜱᴛ Cᴏᴍᴩʟᴇᴛᴇᴅ: \nCᴏᴍᴩʟᴇᴛᴇᴅ Iɴ `{completed_in}`.\n\nTotal Users {total_users}\nCompleted: {done} / {total_users}\nSuccess: {success}\nFailed: {failed}")
-           
-async def send_msg(user_id, message):
-    try:
-        await message.copy(chat_id=int(user_id))
-        return 200
-    except FloodWait as e:
-        await asyncio.sleep(e.value)
-        return send_msg(user_id, message)
-    except InputUserDeactivated:
-        logger.info(f"{user_id} : Deactivated")
-        return 400
-    except UserIsBlocked:
-        logger.info(f"{user_id} : Blocked The Bot")
-        return 400
-    except PeerIdInvalid:
-        logger.info(f"{user_id} : User ID Invalid")
-        return 400
-    except Exception as e:
-        logger.error(f"{user_id} : {e}")
-        return 500
+    await start_broadcast(bot, m.reply_to_message, sts_msg)
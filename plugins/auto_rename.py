@@ -5,7 +5,27 @@ import os
 import re
 from pyrogram import Client, filters
 from pyrogram.types import Message, InlineKeyboardButton, InlineKeyboardMarkup
+from helper.activity import activity
+from helper.caption import render_caption
 from helper.database import DARKXSIDE78
+from helper.derive import wants_derived_media, send_derived_media
+from helper.ffmpeg import VIDEO_EXTENSIONS, add_metadata
+from helper.naming import compile_rules, format_filename
+from helper.output_cache import begin_output
+from helper.progress import ProgressReporter
+from helper.scheduler import REFUSED, queue_rename
+from helper.source_cache import source_cache
+from helper.thumbnail import resolve_thumbnail
+from helper.transfer import can_stream_rename, stream_rename
+
+UNSAFE_CHARS = re.compile(r'[^\w\s\-\.\(\)\[\]]+')
+# Resolution, codec, source and [tag]/(tag) noise stripped by AI rename
+UNWANTED_PATTERNS = re.compile(
+    r'\b\d{3,4}p\b|\bx264\b|\bx265\b|\bHEVC\b|\bAVC\b'
+    r'|\bWEBRip\b|\bBDRip\b|\bWEB-DL\b|\bBluRay\b'
+    r'|\[\w+\]|\(\w+\)',
+    re.IGNORECASE
+)
 
 def get_readable_file_size(size_bytes):
     """Convert bytes to readable format"""
@@ -21,6 +41,19 @@ def get_readable_file_size(size_bytes):
 async def auto_rename_command(client, message: Message):
     """Auto rename command handler"""
     user_id = message.from_user.id
+    
+    # /autorename <template> sets the rename format
+    if len(message.command) > 1:
+        format_template = message.text.split(" ", 1)[1].strip()
+        await DARKXSIDE78.set_format_template(user_id, format_template)
+        preview = format_filename(format_template, "[Group] Show Name S01E05 1080p Dual Audio.mkv")
+        await message.reply_text(
+            f"✅ **Format Template Saved**\n\n"
+            f"**Template:** `{format_template}`\n"
+            f"**Example:** `{preview}`"
+        )
+        return
+    
     settings = await DARKXSIDE78.get_user_settings(user_id)
     
     # Check if Manual Mode is active
@@ -85,10 +118,12 @@ async def auto_rename_callbacks(client, query):
         except ImportError:
             await query.answer("Settings not available", show_alert=True)
 
-async def auto_rename_file(client, message: Message):
+async def auto_rename_file(client, message: Message, ctx=None):
     """Auto rename file - only if not in Manual mode"""
     user_id = message.from_user.id
-    settings = await DARKXSIDE78.get_user_settings(user_id)
+    if ctx is None:
+        ctx = await DARKXSIDE78.get_rename_context(user_id)
+    settings = ctx['settings']
     
     # Check if Manual Mode is active
     if settings.get('rename_mode') == "Manual":
@@ -98,16 +133,18 @@ async def auto_rename_file(client, message: Message):
     rename_mode = settings.get('rename_mode', 'Manual')
     
     if rename_mode == "Auto":
-        return await handle_auto_rename(client, message)
+        return await handle_auto_rename(client, message, ctx)
     elif rename_mode == "AI":
-        return await handle_ai_rename(client, message)
+        return await handle_ai_rename(client, message, ctx)
     
     return False
 
-async def handle_auto_rename(client, message: Message):
+async def handle_auto_rename(client, message: Message, ctx=None):
     """Handle automatic renaming using patterns"""
     try:
         user_id = message.from_user.id
+        if ctx is None:
+            ctx = await DARKXSIDE78.get_rename_context(user_id)
         
         # Get file info
         file_name = None
@@ -121,13 +158,8 @@ async def handle_auto_rename(client, message: Message):
         if not file_name:
             return False
         
-        # Get user settings
-        prefix = await DARKXSIDE78.get_prefix(user_id) or ""
-        suffix = await DARKXSIDE78.get_suffix(user_id) or ""
-        remove_words = await DARKXSIDE78.get_remove_words(user_id) or ""
-        
-        # Process filename
-        new_name = process_filename_auto(file_name, prefix, suffix, remove_words)
+        # Apply the user's format template, then prefix/suffix/remove words
+        new_name = build_auto_filename(file_name, ctx)
         
         if new_name != file_name:
             # Show auto rename result
@@ -141,8 +173,15 @@ Processing file..."""
             status_msg = await message.reply_text(text)
             
             # Apply the rename and upload
-            success = await rename_and_upload_file(client, message, new_name)
+            success = await queue_rename(
+                message,
+                lambda: rename_and_upload_file(client, message, new_name, ctx),
+                premium=ctx['is_premium'],
+                notify=status_msg
+            )
             
+            if success is REFUSED:
+                return REFUSED
             if success:
                 await status_msg.edit_text(
                     f"✅ **File Auto Renamed & Uploaded**\n\n"
@@ -159,7 +198,7 @@ Processing file..."""
         logging.error(f"Auto rename error: {e}")
         return False
 
-async def handle_ai_rename(client, message: Message):
+async def handle_ai_rename(client, message: Message, ctx=None):
     """Handle AI-powered renaming"""
     try:
         user_id = message.from_user.id
@@ -195,8 +234,15 @@ async def handle_ai_rename(client, message: Message):
             )
             
             # Apply AI rename
-            success = await rename_and_upload_file(client, message, ai_name)
+            success = await queue_rename(
+                message,
+                lambda: rename_and_upload_file(client, message, ai_name, ctx),
+                premium=ctx['is_premium'],
+                notify=status_msg
+            )
             
+            if success is REFUSED:
+                return REFUSED
             if success:
                 await status_msg.edit_text(
                     f"✅ **AI Rename Applied Successfully**\n\n"
@@ -218,6 +264,19 @@ async def handle_ai_rename(client, message: Message):
         logging.error(f"AI rename error: {e}")
         return False
 
+def build_auto_filename(file_name, ctx):
+    """New filename from the user's format template and rename rules"""
+    settings = ctx['settings']
+    base_name = file_name
+    if ctx['format_template']:
+        base_name = format_filename(ctx['format_template'], file_name)
+    return process_filename_auto(
+        base_name,
+        settings['prefix'] or "",
+        settings['suffix'] or "",
+        settings['remove_words'] or ""
+    )
+
 def process_filename_auto(filename, prefix="", suffix="", remove_words=""):
     """Process filename with auto rename rules"""
     try:
@@ -249,19 +308,8 @@ def process_filename_auto(filename, prefix="", suffix="", remove_words=""):
 def apply_remove_words(text, remove_pattern):
     """Apply remove/replace words pattern"""
     try:
-        # Split by | for multiple patterns
-        patterns = remove_pattern.split('|')
-        
-        for pattern in patterns:
-            if ':' in pattern:
-                # Replace pattern (find:replace)
-                find, replace = pattern.split(':', 1)
-                text = text.replace(find, replace)
-            else:
-                # Remove pattern
-                text = text.replace(pattern, '')
-        
-        return text
+        # Compiled once per spec, then a single pass over the name
+        return compile_rules(remove_pattern).apply(text)
         
     except Exception as e:
         logging.error(f"Remove words error: {e}")
@@ -274,7 +322,7 @@ def clean_filename(filename):
         filename = ' '.join(filename.split())
         
         # Remove special characters but keep useful ones
-        filename = re.sub(r'[^\w\s\-\.\(\)\[\]]+', '', filename)
+        filename = UNSAFE_CHARS.sub('', filename)
         
         # Remove multiple dots except the last one
         parts = filename.split('.')
@@ -301,18 +349,7 @@ async def generate_ai_filename(filename):
         ai_name = name
         
         # Remove common unwanted patterns
-        unwanted_patterns = [
-            r'\b\d{3,4}p\b',  # Remove resolution like 720p, 1080p
-            r'\bx264\b', r'\bx265\b',  # Remove codec info
-            r'\bHEVC\b', r'\bAVC\b',
-            r'\bWEBRip\b', r'\bBDRip\b',
-            r'\bWEB-DL\b', r'\bBluRay\b',
-            r'\[\w+\]',  # Remove [tags]
-            r'\(\w+\)',  # Remove (tags)
-        ]
-        
-        for pattern in unwanted_patterns:
-            ai_name = re.sub(pattern, '', ai_name, flags=re.IGNORECASE)
+        ai_name = UNWANTED_PATTERNS.sub('', ai_name)
         
         # Clean up spaces
         ai_name = ' '.join(ai_name.split())
@@ -326,16 +363,50 @@ async def generate_ai_filename(filename):
         logging.error(f"AI filename generation error: {e}")
         return None
 
-async def rename_and_upload_file(client, message: Message, new_filename):
+async def rename_and_upload_file(client, message: Message, new_filename, ctx=None):
     """Rename and upload file with new filename"""
+    flight = None
+    derive_task = None
+    new_file_path = None
+    status_msg = None
+    progress = None
     try:
         user_id = message.from_user.id
+        if ctx is None:
+            ctx = await DARKXSIDE78.get_rename_context(user_id)
+        
+        # Same source, same settings: resend the running or earlier upload
+        flight = await begin_output(client, message, new_filename, ctx)
+        if flight is None:
+            activity.record_rename(message)
+            return True
+        
+        # Pure renames skip the local download/re-read round trip, unless
+        # the source is cached and needs no download at all
+        if can_stream_rename(message, ctx, new_filename) and not source_cache.contains(message):
+            status_msg = await message.reply_text("🔄 Renaming file...")
+            progress = ProgressReporter(status_msg, "🔄 Renaming file...")
+            thumbnail = await resolve_thumbnail(client, message, ctx['thumbnail'])
+            caption = await render_caption(ctx['caption'], message, new_filename)
+            sent = await stream_rename(
+                client, message, new_filename, caption, thumbnail, progress.update,
+                chunks=source_cache.tee(message, client.stream_media(message))
+            )
+            if sent:
+                await flight.finish(sent)
+                activity.record_rename(message)
+                return True
+            await progress.stop()
+            await status_msg.delete()
+            status_msg = None
         
         # Download the file
         status_msg = await message.reply_text("📥 Downloading file...")
         
         # Get file path
-        file_path = await message.download()
+        progress = ProgressReporter(status_msg, "📥 Downloading file...")
+        file_path = await source_cache.fetch(message, progress.update)
+        await progress.stop()
         
         await status_msg.edit_text("🔄 Renaming file...")
         
@@ -346,71 +417,110 @@ async def rename_and_upload_file(client, message: Message, new_filename):
         # Rename file
         os.rename(file_path, new_file_path)
         
+        # Write the user's metadata tags (stream copy, no re-encode)
+        if ctx['metadata'] == 'On':
+            await status_msg.edit_text("🏷️ Adding metadata...")
+            await add_metadata(new_file_path, ctx['metadata_fields'])
+        
+        # Sample/screenshots are cut from the local file alongside the upload
+        if wants_derived_media(message, new_file_path, ctx['settings']):
+            derive_task = asyncio.create_task(
+                send_derived_media(client, message, new_file_path, ctx['settings'])
+            )
+        
         await status_msg.edit_text("📤 Uploading renamed file...")
+        progress.restart("📤 Uploading renamed file...")
         
         # Get user settings for upload
-        settings = await DARKXSIDE78.get_user_settings(user_id)
-        thumbnail = await DARKXSIDE78.get_thumbnail(user_id)
-        caption = await DARKXSIDE78.get_caption(user_id)
+        settings = ctx['settings']
+        thumbnail = await resolve_thumbnail(client, message, ctx['thumbnail'], new_file_path)
+        caption = ctx['caption']
         
         # Prepare caption
-        final_caption = caption or new_filename
+        final_caption = await render_caption(caption, message, new_filename, new_file_path)
         
         # Upload based on file type and settings
+        sent = None
         if message.document:
-            if settings.get('send_as') == 'media' and new_filename.lower().endswith(('.mp4', '.avi', '.mkv', '.mov')):
-                await client.send_video(
+            if settings.get('send_as') == 'media' and new_filename.lower().endswith(VIDEO_EXTENSIONS):
+                sent = await client.send_video(
                     chat_id=message.chat.id,
                     video=new_file_path,
                     caption=final_caption,
                     thumb=thumbnail,
-                    supports_streaming=True
+                    supports_streaming=True,
+                    progress=progress.update
                 )
             else:
-                await client.send_document(
+                sent = await client.send_document(
                     chat_id=message.chat.id,
                     document=new_file_path,
                     caption=final_caption,
-                    thumb=thumbnail
+                    thumb=thumbnail,
+                    progress=progress.update
                 )
         elif message.video:
-            await client.send_video(
+            sent = await client.send_video(
                 chat_id=message.chat.id,
                 video=new_file_path,
                 caption=final_caption,
                 thumb=thumbnail,
-                supports_streaming=True
+                supports_streaming=True,
+                progress=progress.update
             )
         elif message.audio:
-            await client.send_audio(
+            sent = await client.send_audio(
                 chat_id=message.chat.id,
                 audio=new_file_path,
                 caption=final_caption,
-                thumb=thumbnail
+                thumb=thumbnail,
+                progress=progress.update
             )
         
-        # Clean up
-        try:
-            os.remove(new_file_path)
-        except:
-            pass
-            
-        await status_msg.delete()
+        await progress.stop()
+        await flight.finish(sent)
+        
+        if derive_task is not None:
+            await derive_task
+        
+        activity.record_rename(message)
         return True
         
     except Exception as e:
         logging.error(f"Rename and upload error: {e}")
         return False
+    finally:
+        # A failed upload stops the sample/screenshots before their file goes
+        if derive_task is not None and not derive_task.done():
+            derive_task.cancel()
+            await asyncio.gather(derive_task, return_exceptions=True)
+        # Clean up
+        if new_file_path is not None:
+            try:
+                os.remove(new_file_path)
+            except OSError:
+                pass
+        if flight is not None:
+            flight.release()
+        if progress:
+            await progress.stop()
+        if status_msg:
+            try:
+                await status_msg.delete()
+            except Exception:
+                pass
 
-async def upload_file_without_rename(client, message: Message):
+async def upload_file_without_rename(client, message: Message, ctx=None):
     """Upload file without renaming"""
     try:
         user_id = message.from_user.id
+        if ctx is None:
+            ctx = await DARKXSIDE78.get_rename_context(user_id)
         
         # Get user settings
-        settings = await DARKXSIDE78.get_user_settings(user_id)
-        thumbnail = await DARKXSIDE78.get_thumbnail(user_id)
-        caption = await DARKXSIDE78.get_caption(user_id)
+        settings = ctx['settings']
+        thumbnail = ctx['thumbnail']
+        caption = ctx['caption']
         
         # Get original filename
         original_name = None
@@ -427,7 +537,7 @@ async def upload_file_without_rename(client, message: Message):
         
         # Upload based on file type
         if message.document:
-            if settings.get('send_as') == 'media' and original_name and original_name.lower().endswith(('.mp4', '.avi', '.mkv', '.mov')):
+            if settings.get('send_as') == 'media' and original_name and original_name.lower().endswith(VIDEO_EXTENSIONS):
                 await client.send_video(
                     chat_id=message.chat.id,
                     video=message.document.file_id,
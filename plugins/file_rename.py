@@ -2,14 +2,32 @@ import asyncio
 import logging
 import os
 import math
+import time
 from pyrogram import Client, filters
-from pyrogram.types import Message, InlineKeyboardButton, InlineKeyboardMarkup
+from pyrogram.types import Message
+from config import Config
+from helper.activity import activity
+from helper.batch import ReorderBuffer, batch_sessions
+from helper.metering import reserve_renames
+from helper.caption import render_caption
 from helper.database import DARKXSIDE78
-from plugins.auto_rename import auto_rename_file
+from helper.derive import wants_derived_media, send_derived_media
+from helper.ffmpeg import VIDEO_EXTENSIONS, add_metadata
+from helper.naming import episode_number, parse_release_name
+from helper.output_cache import begin_output, remember_output
+from helper.progress import ProgressReporter
+from helper.scheduler import REFUSED, queue_rename, rename_scheduler
+from helper.source_cache import source_cache
+from helper.thumbnail import resolve_thumbnail
+from helper.transfer import can_stream_rename, stream_rename
+from plugins.auto_rename import auto_rename_file, build_auto_filename, generate_ai_filename
 
 # Store user states for file renaming
 user_rename_states = {}
 
+# Minimum seconds between edits of a batch's progress message
+BATCH_STATUS_INTERVAL = 5
+
 def get_readable_file_size(size_bytes):
     """Convert bytes to readable format"""
     if size_bytes == 0:
@@ -29,11 +47,31 @@ async def clear_user_rename_state_after_timeout(user_id: int, timeout: int):
 @Client.on_message(filters.private & (filters.document | filters.video | filters.audio))
 async def handle_file_for_rename(client, message: Message):
     """Handle incoming files for renaming"""
+    # Files sent while a /batchrename session is open are collected, not processed
+    if batch_sessions.add(message.from_user.id, message):
+        return
+    
+    # Hand off to a task so a burst of files doesn't pin the dispatcher
+    # workers; the transfers themselves are bounded by the rename scheduler
+    asyncio.create_task(process_file_for_rename(client, message))
+
+async def process_file_for_rename(client, message: Message):
+    """Pick manual or auto rename for an incoming file"""
     user_id = message.from_user.id
     
-    # Get user settings
-    settings = await DARKXSIDE78.get_user_settings(user_id)
-    rename_mode = settings.get('rename_mode', 'Manual')
+    # Get everything the rename pipeline needs in one lookup
+    ctx = await DARKXSIDE78.get_rename_context(user_id)
+    rename_mode = ctx['settings'].get('rename_mode', 'Manual')
+    
+    # Albums (including forwarded ones) arrive as a burst: rename them as one batch
+    if message.media_group_id and rename_mode != "Manual":
+        key = (user_id, message.media_group_id)
+        batch_sessions.open(
+            key, lambda session: process_batch(client, session),
+            Config.MEDIA_GROUP_QUIET_PERIOD, Config.BATCH_MAX_FILES
+        )
+        batch_sessions.add(key, message)
+        return
     
     # If Manual Mode is active, show direct rename prompt
     if rename_mode == "Manual":
@@ -41,7 +79,11 @@ async def handle_file_for_rename(client, message: Message):
         return
     
     # Try auto-rename for Auto/AI modes
-    auto_renamed = await auto_rename_file(client, message)
+    auto_renamed = await auto_rename_file(client, message, ctx)
+    
+    # Out of tokens: the user was told, a manual prompt would only be refused too
+    if auto_renamed is REFUSED:
+        return
     
     # If auto-rename failed or not applicable, show manual rename
     if not auto_renamed:
@@ -70,7 +112,7 @@ async def show_direct_manual_rename(client, message: Message):
     # Store the rename message for deletion
     user_rename_states[user_id]['rename_message'] = rename_msg
 
-@Client.on_message(filters.private & filters.text & ~filters.command(["start", "help", "settings", "autorename", "metadata", "tutorial", "token", "gentoken", "rename", "analyze", "batchrename"]))
+@Client.on_message(filters.private & filters.text & ~filters.command(["start", "help", "settings", "autorename", "metadata", "tutorial", "token", "gentoken", "rename", "analyze", "batchrename", "done", "ssequence", "esequence"]))
 async def handle_manual_rename_input(client, message: Message):
     """Handle manual rename filename input"""
     user_id = message.from_user.id
@@ -118,85 +160,177 @@ async def handle_manual_rename_input(client, message: Message):
             return
         
         # Start rename and upload process
-        success = await rename_and_upload_file_direct(client, original_msg, new_filename)
+        ctx = await DARKXSIDE78.get_rename_context(user_id)
+        success = await queue_rename(
+            original_msg,
+            lambda: rename_and_upload_file_direct(client, original_msg, new_filename, ctx, show_progress=True),
+            premium=ctx['is_premium']
+        )
         
         # Clear state
         if user_id in user_rename_states:
             del user_rename_states[user_id]
         
+        # On REFUSED the user was already told they're out of tokens
+        if success is not REFUSED and not success:
+            await message.reply_text("❌ **Rename failed!**")
+        
     except Exception as e:
         logging.error(f"Manual rename input error: {e}")
         # Clear state on error
         if user_id in user_rename_states:
             del user_rename_states[user_id]
 
-async def rename_and_upload_file_direct(client, message: Message, new_filename):
-    """Rename and upload file directly without status messages"""
+async def rename_and_upload_file_direct(client, message: Message, new_filename, ctx=None, show_progress=False):
+    """Rename and upload file directly, with one progress message if `show_progress`"""
+    status_msg = None
+    progress = None
+    flight = None
     try:
         user_id = message.from_user.id
+        if ctx is None:
+            ctx = await DARKXSIDE78.get_rename_context(user_id)
         
-        # Start downloading immediately
-        file_path = await message.download()
+        # Same source, same settings: resend the running or earlier upload
+        flight = await begin_output(client, message, new_filename, ctx)
+        if flight is None:
+            activity.record_rename(message)
+            return True
         
-        # Create new file path with new name
-        directory = os.path.dirname(file_path)
-        new_file_path = os.path.join(directory, new_filename)
+        if show_progress:
+            status_msg = await message.reply_text("📥 Downloading file...")
+            progress = ProgressReporter(status_msg, "📥 Downloading file...")
+        report = progress.update if progress else None
         
-        # Rename file
-        os.rename(file_path, new_file_path)
+        # Pure renames skip the local download/re-read round trip, unless
+        # the source is cached and needs no download at all
+        if can_stream_rename(message, ctx, new_filename) and not source_cache.contains(message):
+            if progress:
+                progress.action = "🔄 Renaming file..."
+            thumbnail = await resolve_thumbnail(client, message, ctx['thumbnail'])
+            caption = await render_caption(ctx['caption'], message, new_filename)
+            sent = await stream_rename(
+                client, message, new_filename, caption, thumbnail, report,
+                chunks=source_cache.tee(message, client.stream_media(message))
+            )
+            if sent:
+                await flight.finish(sent)
+                activity.record_rename(message)
+                return True
+            if progress:
+                await progress.stop()
+                progress.restart("📥 Downloading file...")
+        
+        new_file_path = await prepare_renamed_file(message, new_filename, ctx, report)
+        if progress:
+            await progress.stop()
+            progress.restart("📤 Uploading file...")
+        sent = await upload_renamed_file(client, message, new_file_path, new_filename, ctx, report)
+        await flight.finish(sent)
+        return True
+        
+    except Exception as e:
+        logging.error(f"Direct rename and upload error: {e}")
+        return False
+    finally:
+        if flight is not None:
+            flight.release()
+        if progress:
+            await progress.stop()
+        if status_msg:
+            try:
+                await status_msg.delete()
+            except Exception:
+                pass
+
+async def prepare_renamed_file(message: Message, new_filename, ctx, progress=None):
+    """Download a file under its new name and apply metadata; returns the local path"""
+    # Repeat renames of the same upload are served from the local source cache
+    file_path = await source_cache.fetch(message, progress)
+    
+    # Create new file path with new name
+    directory = os.path.dirname(file_path)
+    new_file_path = os.path.join(directory, new_filename)
+    
+    # Rename file
+    os.rename(file_path, new_file_path)
+    
+    # Write the user's metadata tags (stream copy, no re-encode)
+    if ctx['metadata'] == 'On':
+        await add_metadata(new_file_path, ctx['metadata_fields'])
+    
+    return new_file_path
+
+async def upload_renamed_file(client, message: Message, new_file_path, new_filename, ctx, progress=None):
+    """Upload a prepared file with the user's settings, then remove it; returns the sent message"""
+    derive_task = None
+    try:
+        # Sample/screenshots are cut from the local file alongside the upload
+        if wants_derived_media(message, new_file_path, ctx['settings']):
+            derive_task = asyncio.create_task(
+                send_derived_media(client, message, new_file_path, ctx['settings'])
+            )
         
         # Get user settings for upload
-        settings = await DARKXSIDE78.get_user_settings(user_id)
-        thumbnail = await DARKXSIDE78.get_thumbnail(user_id)
-        caption = await DARKXSIDE78.get_caption(user_id)
+        settings = ctx['settings']
+        thumbnail = await resolve_thumbnail(client, message, ctx['thumbnail'], new_file_path)
+        caption = ctx['caption']
         
         # Prepare caption
-        final_caption = caption or new_filename
+        final_caption = await render_caption(caption, message, new_filename, new_file_path)
         
         # Upload based on file type and settings
+        sent = None
         if message.document:
-            if settings.get('send_as') == 'media' and new_filename.lower().endswith(('.mp4', '.avi', '.mkv', '.mov')):
-                await client.send_video(
+            if settings.get('send_as') == 'media' and new_filename.lower().endswith(VIDEO_EXTENSIONS):
+                sent = await client.send_video(
                     chat_id=message.chat.id,
                     video=new_file_path,
                     caption=final_caption,
                     thumb=thumbnail,
-                    supports_streaming=True
+                    supports_streaming=True,
+                    progress=progress
                 )
             else:
-                await client.send_document(
+                sent = await client.send_document(
                     chat_id=message.chat.id,
                     document=new_file_path,
                     caption=final_caption,
-                    thumb=thumbnail
+                    thumb=thumbnail,
+                    progress=progress
                 )
         elif message.video:
-            await client.send_video(
+            sent = await client.send_video(
                 chat_id=message.chat.id,
                 video=new_file_path,
                 caption=final_caption,
                 thumb=thumbnail,
-                supports_streaming=True
+                supports_streaming=True,
+                progress=progress
             )
         elif message.audio:
-            await client.send_audio(
+            sent = await client.send_audio(
                 chat_id=message.chat.id,
                 audio=new_file_path,
                 caption=final_caption,
-                thumb=thumbnail
+                thumb=thumbnail,
+                progress=progress
             )
         
+        if derive_task is not None:
+            await derive_task
+        activity.record_rename(message)
+        return sent
+    finally:
+        # A failed upload stops the sample/screenshots before their file goes
+        if derive_task is not None and not derive_task.done():
+            derive_task.cancel()
+            await asyncio.gather(derive_task, return_exceptions=True)
         # Clean up
         try:
             os.remove(new_file_path)
         except:
             pass
-            
-        return True
-        
-    except Exception as e:
-        logging.error(f"Direct rename and upload error: {e}")
-        return False
 
 @Client.on_message(filters.private & filters.command("rename"))
 async def manual_rename_command(client, message: Message):
@@ -215,8 +349,15 @@ async def manual_rename_command(client, message: Message):
                 # Validate filename
                 if new_filename and not any(char in new_filename for char in ['/', '\\', ':', '*', '?', '"', '<', '>', '|']):
                     # Start direct rename
-                    success = await rename_and_upload_file_direct(client, replied_msg, new_filename)
+                    ctx = await DARKXSIDE78.get_rename_context(user_id)
+                    success = await queue_rename(
+                        replied_msg,
+                        lambda: rename_and_upload_file_direct(client, replied_msg, new_filename, ctx, show_progress=True),
+                        premium=ctx['is_premium']
+                    )
                     
+                    if success is REFUSED:
+                        return
                     if success:
                         await message.reply_text(f"✅ **File renamed to:** `{new_filename}`")
                     else:
@@ -313,12 +454,175 @@ async def analyze_file_command(client, message: Message):
 # Batch rename functionality
 @Client.on_message(filters.private & filters.command("batchrename"))
 async def batch_rename_command(client, message: Message):
-    """Batch rename command for multiple files"""
-    await message.reply_text(
+    """Open a batch session that collects files until /done or a quiet period"""
+    user_id = message.from_user.id
+    
+    if len(message.command) > 1 and message.command[1].lower() == "cancel":
+        session = batch_sessions.cancel(user_id)
+        if session:
+            await session.status.edit_text(
+                f"❌ **Batch Cancelled**\n\n{len(session.messages)} collected file(s) discarded."
+            )
+        else:
+            await message.reply_text("❌ **No batch in progress.**")
+        return
+    
+    if batch_sessions.get(user_id):
+        await message.reply_text("🔄 **Batch already open.** Send files, then /done.")
+        return
+    
+    status = await message.reply_text(
         "🔄 **Batch Rename Mode**\n\n"
-        "Send multiple files and they will be processed according to your rename settings.\n\n"
-        "Current Mode: Auto processing based on your settings"
+        "Send or forward your files now. They will be renamed together according to your rename settings.\n\n"
+        f"Send /done when finished (or wait {Config.BATCH_QUIET_PERIOD}s after the last file).\n"
+        "Send `/batchrename cancel` to discard the batch."
+    )
+    batch_sessions.open(
+        user_id, lambda session: process_batch(client, session),
+        Config.BATCH_QUIET_PERIOD, Config.BATCH_MAX_FILES, status=status
+    )
+
+@Client.on_message(filters.private & filters.command("ssequence"))
+async def start_sequence_command(client, message: Message):
+    """Open a batch session whose uploads are released in episode order"""
+    user_id = message.from_user.id
+    if batch_sessions.get(user_id):
+        await message.reply_text("🔄 **A batch is already open.** Send files, then /esequence.")
+        return
+    
+    status = await message.reply_text(
+        "🔢 **Sequence Mode**\n\n"
+        "Send or forward your episodes in any order. They are downloaded in parallel "
+        "and uploaded sorted by season and episode.\n\n"
+        f"Send /esequence when finished (or wait {Config.BATCH_QUIET_PERIOD}s after the last file)."
+    )
+    batch_sessions.open(
+        user_id, lambda session: process_batch(client, session, ordered=True),
+        Config.BATCH_QUIET_PERIOD, Config.BATCH_MAX_FILES, status=status
+    )
+
+@Client.on_message(filters.private & filters.command(["done", "esequence"]))
+async def batch_done_command(client, message: Message):
+    """Close the user's batch session and start processing it"""
+    if not batch_sessions.close(message.from_user.id):
+        await message.reply_text("❌ **No batch in progress.**\n\nStart one with /batchrename or /ssequence")
+
+def sequence_key(message: Message):
+    """Sort key putting files in season/episode order, then by name"""
+    name = get_original_filename(message)
+    try:
+        info = parse_release_name(name)
+        return (int(info['season'] or 0), episode_number(info['episode']), name.lower())
+    except Exception as e:
+        # An odd name sorts last instead of aborting the whole batch
+        logging.warning(f"Couldn't parse {name!r} for sequencing: {e}")
+        return (float('inf'), 0, name.lower())
+
+async def process_batch(client, session, ordered=False):
+    """Rename and upload every file of a closed batch session.
+
+    With `ordered`, files are sorted by season/episode and, while still
+    downloaded in parallel, uploaded strictly in that order.
+    """
+    messages = sorted(session.messages, key=sequence_key if ordered else (lambda m: m.id))
+    status = session.status
+    if not messages:
+        if status:
+            await status.edit_text("❌ **Batch closed**\n\nNo files were received.")
+        return
+    
+    user_id = messages[0].from_user.id
+    
+    # Settings are resolved once for the whole batch
+    ctx = await DARKXSIDE78.get_rename_context(user_id)
+    
+    # Work out every new name in one pass before any transfer starts
+    jobs = []
+    for msg in messages:
+        original_name = get_original_filename(msg)
+        new_name = None
+        if ctx['settings'].get('rename_mode') == "AI":
+            new_name = await generate_ai_filename(original_name)
+        jobs.append((msg, new_name or build_auto_filename(original_name, ctx)))
+    
+    total = len(jobs)
+    if status is None:
+        status = await messages[0].reply_text(f"🔄 **Batch Rename**\n\nProcessing {total} file(s)...")
+    else:
+        await status.edit_text(f"🔄 **Batch Rename**\n\nProcessing {total} file(s)...")
+    
+    # Tokens for the whole batch are taken in one update; failed files are refunded
+    reservation = await reserve_renames(messages[0], total, notify=status)
+    if reservation is None:
+        return
+    
+    progress = {'done': 0, 'failed': [], 'last_edit': time.monotonic()}
+    reorder = ReorderBuffer(Config.SEQUENCE_WINDOW) if ordered else None
+    
+    async def run_ordered(index, msg, new_name):
+        # Downloads overlap through the scheduler; the upload waits its turn
+        # outside it so a waiting upload never holds a transfer slot
+        await reorder.reserve(index)
+        new_file_path = None
+        try:
+            new_file_path = await rename_scheduler.submit(
+                user_id,
+                lambda: prepare_renamed_file(msg, new_name, ctx),
+                premium=ctx['is_premium']
+            )
+        except Exception as e:
+            logging.error(f"Sequence download error: {e}")
+        
+        await reorder.turn(index)
+        try:
+            if new_file_path is None:
+                return False
+            sent = await upload_renamed_file(client, msg, new_file_path, new_name, ctx)
+            await remember_output(msg, new_name, ctx, sent)
+            return True
+        except Exception as e:
+            logging.error(f"Sequence upload error: {e}")
+            return False
+        finally:
+            await reorder.release()
+    
+    async def run(index, msg, new_name):
+        if ordered:
+            success = await run_ordered(index, msg, new_name)
+        else:
+            # The scheduler bounds how many of these transfer at once
+            success = await rename_scheduler.submit(
+                user_id,
+                lambda: rename_and_upload_file_direct(client, msg, new_name, ctx),
+                premium=ctx['is_premium']
+            )
+        progress['done'] += 1
+        if not success:
+            progress['failed'].append(new_name)
+        
+        # One status message for the whole batch, edited at most every few seconds
+        now = time.monotonic()
+        if progress['done'] < total and now - progress['last_edit'] >= BATCH_STATUS_INTERVAL:
+            progress['last_edit'] = now
+            try:
+                await status.edit_text(
+                    f"🔄 **Batch Rename**\n\n"
+                    f"Completed: **{progress['done']}/{total}**\n"
+                    f"Failed: **{len(progress['failed'])}**"
+                )
+            except Exception:
+                pass
+    
+    await asyncio.gather(*(run(index, msg, new_name) for index, (msg, new_name) in enumerate(jobs)))
+    await reservation.refund(len(progress['failed']))
+    
+    text = (
+        f"✅ **Batch Rename Complete**\n\n"
+        f"Renamed: **{total - len(progress['failed'])}/{total}**"
     )
+    if progress['failed']:
+        text += "\n\n❌ **Failed:**\n" + "\n".join(f"• `{name}`" for name in progress['failed'][:20])
+    await status.edit_text(text)
 
 # File type specific handlers
 @Client.on_message(filters.private & filters.document & filters.regex(r'\.(mp4|avi|mkv|mov|wmv|flv|webm)$'))
@@ -1,5 +1,8 @@
-import os
+import asyncio
+import logging
+import time
 from pyrogram import Client, filters
+from pyrogram.enums import ChatMemberStatus
 from pyrogram.types import InlineKeyboardButton, InlineKeyboardMarkup, CallbackQuery
 from pyrogram.errors import UserNotParticipant
 from config import Config
@@ -7,26 +10,59 @@ from config import Config
 FORCE_SUB_CHANNELS = Config.FORCE_SUB_CHANNELS
 IMAGE_URL = "https://graph.org/file/a27d85469761da836337c.jpg"
 
-async def not_subscribed(_, __, message):
+# (user_id, channel) -> (expires_at, is_member). Members are rechecked
+# rarely; non-members and failed checks soon, so joining (or fixing the
+# channel setup) takes effect without pressing "Joined"
+_membership_cache = {}
+_CACHE_PRUNE_SIZE = 10000
+
+async def _is_member(client, channel, user_id):
+    key = (user_id, channel)
+    entry = _membership_cache.get(key)
+    now = time.monotonic()
+    if entry is not None and entry[0] > now:
+        return entry[1]
+
+    failed = False
+    try:
+        member = await client.get_chat_member(channel, user_id)
+        is_member = member.status not in {ChatMemberStatus.LEFT, ChatMemberStatus.BANNED}
+    except UserNotParticipant:
+        is_member = False
+    except Exception as e:
+        # Misconfigured channel (bot not admin, bad username): don't lock
+        # users out, but don't ask Telegram again on every message either
+        logging.error(f"Force-sub check failed for {channel}: {e}")
+        is_member, failed = True, True
+
+    if len(_membership_cache) >= _CACHE_PRUNE_SIZE:
+        for stale in [k for k, v in _membership_cache.items() if v[0] <= now]:
+            del _membership_cache[stale]
+    ttl = Config.FSUB_MEMBER_TTL if is_member and not failed else Config.FSUB_NON_MEMBER_TTL
+    _membership_cache[key] = (now + ttl, is_member)
+    return is_member
+
+def invalidate_membership(user_id):
+    """Forget a user's cached memberships so the next check asks Telegram"""
     for channel in FORCE_SUB_CHANNELS:
-        try:
-            user = await message._client.get_chat_member(channel, message.from_user.id)
-            if user.status in {"kicked", "left"}:
-                return True
-        except UserNotParticipant:
-            return True
-    return False
+        _membership_cache.pop((user_id, channel), None)
+
+async def get_not_joined_channels(client, user_id):
+    """Force-sub channels the user hasn't joined, checked concurrently and cached"""
+    results = await asyncio.gather(*(
+        _is_member(client, channel, user_id) for channel in FORCE_SUB_CHANNELS
+    ))
+    return [channel for channel, joined in zip(FORCE_SUB_CHANNELS, results) if not joined]
+
+async def not_subscribed(_, __, message):
+    if not FORCE_SUB_CHANNELS or not message.from_user:
+        return False
+    return bool(await get_not_joined_channels(message._client, message.from_user.id))
 
 @Client.on_message(filters.private & filters.create(not_subscribed))
 async def forces_sub(client, message):
-    not_joined_channels = []
-    for channel in FORCE_SUB_CHANNELS:
-        try:
-            user = await client.get_chat_member(channel, message.from_user.id)
-            if user.status in {"kicked", "left"}:
-                not_joined_channels.append(channel)
-        except UserNotParticipant:
-            not_joined_channels.append(channel)
+    # Served from the cache the filter just filled
+    not_joined_channels = await get_not_joined_channels(client, message.from_user.id)
 
     buttons = [
         [
@@ -54,15 +90,10 @@ async def forces_sub(client, message):
 @Client.on_callback_query(filters.regex("check_subscription"))
 async def check_subscription(client, callback_query: CallbackQuery):
     user_id = callback_query.from_user.id
-    not_joined_channels = []
 
-    for channel in FORCE_SUB_CHANNELS:
-        try:
-            user = await client.get_chat_member(channel, user_id)
-            if user.status in {"kicked", "left"}:
-                not_joined_channels.append(channel)
-        except UserNotParticipant:
-            not_joined_channels.append(channel)
+    # The user says they joined: ask Telegram again instead of trusting the cache
+    invalidate_membership(user_id)
+    not_joined_channels = await get_not_joined_channels(client, user_id)
 
     if not not_joined_channels:
         new_text = "**ʏᴏᴜ ʜᴀᴠᴇ ᴊᴏɪɴᴇᴅ ᴀʟʟ ᴛʜᴇ ʀᴇǫᴜɪʀᴇᴅ ᴄʜᴀɴɴᴇʟs. ᴛʜᴀɴᴋ ʏᴏᴜ! 😊 /start ɴᴏᴡ**"
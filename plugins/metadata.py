@@ -8,15 +8,17 @@ async def metadata(client, message):
     user_id = message.from_user.id
 
     # Fetch user metadata from the database
-    current = await db.get_metadata(user_id)
-    title = await db.get_title(user_id)
-    author = await db.get_author(user_id)
-    artist = await db.get_artist(user_id)
-    video = await db.get_video(user_id)
-    audio = await db.get_audio(user_id)
-    subtitle = await db.get_subtitle(user_id)
-    encoded_by = await db.get_encoded_by(user_id)
-    custom_tag = await db.get_custom_tag(user_id)
+    ctx = await db.get_rename_context(user_id)
+    current = ctx['metadata']
+    fields = ctx['metadata_fields']
+    title = fields['title']
+    author = fields['author']
+    artist = fields['artist']
+    video = fields['video']
+    audio = fields['audio']
+    subtitle = fields['subtitle']
+    encoded_by = fields['encoded_by']
+    custom_tag = fields['custom_tag']
 
     # Display the current metadata
     text = f"""
@@ -70,15 +72,17 @@ async def metadata_callback(client, query: CallbackQuery):
         return
 
     # Fetch updated metadata after toggling
-    current = await db.get_metadata(user_id)
-    title = await db.get_title(user_id)
-    author = await db.get_author(user_id)
-    artist = await db.get_artist(user_id)
-    video = await db.get_video(user_id)
-    audio = await db.get_audio(user_id)
-    subtitle = await db.get_subtitle(user_id)
-    encoded_by = await db.get_encoded_by(user_id)
-    custom_tag = await db.get_custom_tag(user_id)
+    ctx = await db.get_rename_context(user_id)
+    current = ctx['metadata']
+    fields = ctx['metadata_fields']
+    title = fields['title']
+    author = fields['author']
+    artist = fields['artist']
+    video = fields['video']
+    audio = fields['audio']
+    subtitle = fields['subtitle']
+    encoded_by = fields['encoded_by']
+    custom_tag = fields['custom_tag']
 
     # Updated metadata message after toggle
     text = f"""
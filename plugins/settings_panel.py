@@ -336,9 +336,11 @@ Send your custom caption for files.
 Timeout: 60 sec
 
 **Available Variables:**
-• {filename} - Original filename
-• {filesize} - File size
-• {duration} - Video duration"""
+• {{filename}} - New filename
+• {{filesize}} - File size
+• {{duration}} - Video duration
+• {{resolution}} - Video resolution
+• {{season}} / {{episode}} - Season and episode number"""
 
     keyboard = InlineKeyboardMarkup([
         [
@@ -487,6 +489,8 @@ find1:change1|find2:change2|...
 • **'change'**: What you want to replace it with. If you leave it blank, it will disappear!
 • **'|'**: Separates different changes.
 
+• **'/regex/'**: Wrap a find in slashes to match a regular expression, e.g. `/\\d{{3,4}}p/:`
+
 You can add as many find:change pairs as you like!
 
 **Example:**
@@ -12,7 +12,17 @@ import aiohttp
 from urllib.parse import quote
 import string
 import logging
-import pytz
+from helper.activity import activity
+
+# Runs ahead of every other handler (group -1) and never stops propagation
+@Client.on_message(filters.private & filters.incoming, group=-1)
+async def track_message_activity(client, message: Message):
+    if message.from_user:
+        activity.touch(message.from_user.id)
+
+@Client.on_callback_query(group=-1)
+async def track_callback_activity(client, query: CallbackQuery):
+    activity.touch(query.from_user.id)
 
 @Client.on_message(filters.command("add_token") & filters.user(Config.ADMIN))
 async def add_tokens(bot: Client, message: Message):
@@ -34,6 +44,7 @@ async def add_tokens(bot: Client, message: Message):
             {"_id": user['_id']},
             {"$set": {"token": new_tokens}}
         )
+        DARKXSIDE78.invalidate_user(user['_id'])
         await message.reply_text(f"✅ Added {amount} tokens to user {user['_id']}. New balance: {new_tokens}")
     except Exception as e:
         await message.reply_text(f"Error: {e}\nUsage: /add_token <amount> @username/userid")
@@ -57,6 +68,7 @@ async def remove_tokens(bot: Client, message: Message):
             {"_id": user['_id']},
             {"$set": {"token": new_tokens}}
         )
+        DARKXSIDE78.invalidate_user(user['_id'])
         await message.reply_text(f"✅ Removed {amount} tokens from user {user['_id']}. New balance: {new_tokens}")
     except Exception as e:
         await message.reply_text(f"Error: {e}\nUsage: /remove_token <amount> @username/userid")
@@ -97,6 +109,7 @@ async def add_premium(bot: Client, message: Message):
                 "premium_expiry": expiry
             }}
         )
+        DARKXSIDE78.invalidate_user(user['_id'])
         await message.reply_text(f"✅ Premium added until {expiry}")
     except Exception as e:
         await message.reply_text(f"Error: {e}\nUsage: /add_premium @username/userid 1d (1h/1m/1y/lifetime)")
@@ -121,6 +134,7 @@ async def remove_premium(bot: Client, message: Message):
                 "premium_expiry": None
             }}
         )
+        DARKXSIDE78.invalidate_user(user['_id'])
         await message.reply_text("✅ Premium access removed")
     except Exception as e:
         await message.reply_text(f"Error: {e}\nUsage: /remove_premium @username/userid")
@@ -145,6 +159,7 @@ async def check_tokens(client, message: Message):
                 {"_id": user_id},
                 {"$set": {"is_premium": False, "premium_expiry": None}}
             )
+            DARKXSIDE78.invalidate_user(user_id)
 
     # Prepare message
     token_count = user_data.get("token", 69)
@@ -254,32 +269,26 @@ async def handle_token_redemption(client: Client, message: Message, token_id: st
     user_id = message.from_user.id
     
     try:
-        # Retrieve token data from the database
-        token_data = await DARKXSIDE78.get_token_link(token_id)
+        # Claim the link in one atomic update so it can't be redeemed twice
+        token_data = await DARKXSIDE78.claim_token_link(token_id, user_id)
         
         if not token_data:
-            return await message.reply("❌ Invalid or expired token link")
-        
-        if token_data['used']:
-            return await message.reply("❌ This link has already been used")
-        
-        # Convert stored naive datetime to UTC-aware datetime
-        expiry_utc = token_data['expiry'].replace(tzinfo=pytz.UTC)
-        
-        if datetime.now(pytz.UTC) > expiry_utc:
+            # Only a failed claim pays for working out why
+            token_data = await DARKXSIDE78.get_token_link(token_id)
+            if not token_data:
+                return await message.reply("❌ Invalid or expired token link")
+            if token_data['used']:
+                return await message.reply("❌ This link has already been used")
+            if token_data['user_id'] != user_id:
+                return await message.reply("❌ This token link belongs to another user")
             return await message.reply("❌ Token expired")
         
-        if token_data['user_id'] != user_id:
-            return await message.reply("❌ This token link belongs to another user")
-        
         # Atomic update of tokens in the database using update_one
         await DARKXSIDE78.col.update_one(
             {"_id": user_id},
             {"$inc": {"token": token_data['tokens']}}
         )
-        
-        # Mark the token as used
-        await DARKXSIDE78.mark_token_used(token_id)
+        DARKXSIDE78.invalidate_user(user_id)
         
         await message.reply(f"✅ Success! {token_data['tokens']} tokens added to your account!")
     